@@ -0,0 +1,131 @@
+"""Admin-only endpoints: bet results, settlement runs, exposure limits and withdrawal approval."""
+from functools import wraps
+
+from flask import Blueprint, request, jsonify, redirect, url_for, flash, abort
+from flask_login import login_required, current_user
+
+from models import db, Bet, SettlementRun
+from money import to_cents
+import risk
+import settlement
+import withdrawals
+
+bp = Blueprint('admin', __name__)
+
+# Chunks one request settles before answering; the admin POSTs to the run again
+# (or runs ``flask settle --resume``) until its status is Completed
+REQUEST_CHUNKS = 10
+TRUE_VALUES = ('1', 'true', 'on', 'yes')
+
+
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def wrapped(*args, **kwargs):
+        if not current_user.is_admin:
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
+
+
+@bp.route('/update_bet_result/<int:bet_id>', methods=['POST'])
+@admin_required
+def update_bet_result(bet_id):
+    result = request.form.get('result', '').capitalize()
+    bet = db.session.get(Bet, bet_id)
+
+    if not bet:
+        flash('Bet not found')
+        return redirect(url_for('web.dashboard'))
+
+    if result not in settlement.PAYOUTS:
+        flash('Invalid result')
+        return redirect(url_for('web.dashboard'))
+
+    settled, _ = settlement.settle_ids([bet.id], {bet.prediction: result}, f'bet:{bet.id}')
+    db.session.commit()
+
+    flash('Bet result updated' if settled else 'Bet result already updated')
+    return redirect(url_for('web.dashboard'))
+
+
+@bp.route('/admin/settlements', methods=['POST'])
+@admin_required
+def start_settlement():
+    """Record a settlement run and settle its first chunks; 202 until the run is Completed."""
+    outcomes = request.get_json(silent=True) or request.form.to_dict()
+    market_id = outcomes.pop('market_id', None)
+    try:
+        # Checked before the run is recorded: starting a market run closes the market
+        chunk_size, chunks = settle_args()
+        if market_id is not None:
+            winners = outcomes.get('winners') or request.form.getlist('winners')
+            void = str(outcomes.get('void', '')).lower() in TRUE_VALUES
+            run = settlement.start_market_run(int(market_id), winners, void)
+        else:
+            run = settlement.start_run(outcomes)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    settlement.settle(run, chunk_size, max_chunks=chunks)
+    return jsonify(run.to_dict()), 201 if run.status == 'Completed' else 202, {
+        'Location': url_for('admin.settlement_run', run_id=run.id)}
+
+
+@bp.route('/admin/settlements/<int:run_id>', methods=['GET', 'POST'])
+@admin_required
+def settlement_run(run_id):
+    """A run's progress; POST settles its next chunks."""
+    run = db.get_or_404(SettlementRun, run_id)
+    if request.method == 'POST':
+        try:
+            chunk_size, chunks = settle_args()
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        settlement.settle(run, chunk_size, max_chunks=chunks)
+    return jsonify(run.to_dict())
+
+
+def settle_args():
+    """``(chunk_size, chunks)`` from the query string; raises ValueError unless both are at least 1."""
+    chunk_size = request.args.get('chunk_size', settlement.DEFAULT_CHUNK_SIZE, type=int)
+    chunks = request.args.get('chunks', REQUEST_CHUNKS, type=int)
+    if chunk_size < 1 or chunks < 1:
+        raise ValueError('chunk_size and chunks must be at least 1')
+    return chunk_size, chunks
+
+
+@bp.route('/admin/exposure')
+@admin_required
+def exposure():
+    selection_id = request.args.get('selection', type=int)
+    event_id = request.args.get('event', type=int)
+    if selection_id is not None or event_id is not None:
+        found = risk.index.selection(selection_id) if selection_id is not None else risk.index.event(event_id)
+        if found is None:
+            abort(404)
+        return jsonify(found.to_dict())
+    top = risk.index.top(request.args.get('limit', 20, type=int))
+    return jsonify(selections=[dict(found.to_dict(), id=selection_id) for selection_id, found in top])
+
+
+@bp.route('/admin/selections/<int:selection_id>/limit', methods=['POST'])
+@admin_required
+def set_selection_limit(selection_id):
+    limit = (request.get_json(silent=True) or request.form).get('limit')
+    try:
+        found = risk.set_limit(selection_id, to_cents(limit) if limit not in (None, '') else None)
+    except ValueError:
+        return jsonify(error='Invalid limit'), 400
+    except LookupError:
+        abort(404)
+    return jsonify(found.to_dict())
+
+
+@bp.route('/admin/withdrawals/approve', methods=['POST'])
+@admin_required
+def approve_withdrawals():
+    data = request.get_json(silent=True) or {}
+    job_ids = data.get('ids', request.form.getlist('ids', type=int) or None)
+    if job_ids is None and not (data.get('all') or request.form.get('all')):
+        return jsonify(error='Pass the ids to approve, or all=true'), 400
+    return jsonify(approved=withdrawals.approve(job_ids))
@@ -0,0 +1,288 @@
+"""JSON API, version 1, mounted at ``/api/v1``.
+
+Clients authenticate with ``Authorization: Bearer <token>``; tokens come from
+``POST /api/v1/tokens`` (username and password) or ``flask create-api-token``
+and only their SHA-256 is stored. Cookie sessions are not accepted here.
+
+Amounts are decimal strings, lists are keyset-paged with the same cursors as
+the HTML history, and the money-moving POSTs honour ``Idempotency-Key``.
+Errors are ``{"error": message}`` with a matching status code; requests over a
+rate limit (see :mod:`ratelimit`) get 429 with Retry-After.
+"""
+import hashlib
+import secrets
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify, g
+from flask_login import current_user
+from sqlalchemy import select, update
+
+from models import db, User, ApiToken, BetSlip
+from money import to_cents, from_cents
+import betting
+import history
+import identity
+import idempotency
+import ledger
+import odds
+import passwords
+import ratelimit
+import risk
+import slips
+import storage
+
+MAX_BATCH_BETS = 20
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_token(user_id, name=None):
+    """Create a token for ``user_id`` and return it; it cannot be recovered later. Does not commit."""
+    token = secrets.token_urlsafe(32)
+    db.session.add(ApiToken(user_id=user_id, token_hash=hash_token(token), name=name))
+    return token
+
+
+def load_user_from_request(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    row = db.session.execute(
+        select(ApiToken.id, ApiToken.user_id)
+        .where(ApiToken.token_hash == hash_token(token.strip()), ApiToken.revoked_at.is_(None))
+    ).first()
+    if row is None:
+        return None
+    user = identity.cache.get(row.user_id)
+    if user is None:
+        return None
+    g.api_token_id = row.id
+    return identity.CachedUser(user)
+
+
+def error(message, status, headers=None):
+    return jsonify(error=message), status, headers or {}
+
+
+def body():
+    return request.get_json(silent=True) or {}
+
+
+def balance(user_id):
+    return str(from_cents(db.session.scalar(select(User.balance_cents).where(User.id == user_id))))
+
+
+@bp.errorhandler(429)
+def too_many_requests(e):
+    return error('Too many requests', 429, {'Retry-After': str(e.retry_after)} if e.retry_after else None)
+
+
+@bp.before_request
+def authenticate():
+    if request.endpoint == 'api.create_token':
+        return None
+    if not current_user.is_authenticated or 'api_token_id' not in g:
+        return error('A valid bearer token is required', 401, {'WWW-Authenticate': 'Bearer'})
+    return None
+
+
+@bp.route('/tokens', methods=['POST'])
+@ratelimit.limit('login', '20/minute', key=ratelimit.by_ip)
+def create_token():
+    data = body()
+    username, password = data.get('username'), data.get('password')
+    ip_key, user_key = ('ip', request.remote_addr), ('user', username)
+    try:
+        passwords.login_ip_throttle.check(ip_key)
+        passwords.login_user_throttle.check(user_key)
+        user = User.query.filter_by(username=username).first()
+        valid = passwords.hasher.verify(user.password if user else None, password)
+    except passwords.Throttled as e:
+        return error('Too many attempts', 429, {'Retry-After': str(e.retry_after)})
+    except passwords.HashingBusy:
+        return error('The server is busy', 503, {'Retry-After': '1'})
+    if not valid:
+        passwords.login_ip_throttle.hit(ip_key)
+        passwords.login_user_throttle.hit(user_key)
+        return error('Invalid username or password', 401)
+    passwords.login_user_throttle.reset(user_key)
+    token = issue_token(user.id, data.get('name'))
+    db.session.commit()
+    return jsonify(token=token), 201
+
+
+@bp.route('/tokens/current', methods=['DELETE'])
+def revoke_token():
+    db.session.execute(update(ApiToken).where(ApiToken.id == g.api_token_id).values(revoked_at=datetime.utcnow()))
+    db.session.commit()
+    return '', 204
+
+
+@bp.route('/balance')
+def get_balance():
+    return jsonify(balance=balance(current_user.id))
+
+
+@bp.route('/bets')
+@storage.read_only
+def list_bets():
+    result, order, cursor, limit = history.page_args(request.args)
+    bets, next_cursor = history.bet_page(current_user.id, result, order, cursor, limit)
+    return jsonify(bets=[bet.to_dict() for bet in bets], next_cursor=next_cursor)
+
+
+def place(item):
+    """Place one bet from a request item; returns the bet or raises ValueError with a message."""
+    try:
+        amount_cents = to_cents(item.get('amount'))
+    except ValueError:
+        raise ValueError('Invalid amount')
+    selection_id = item.get('selection_id')
+    if not isinstance(selection_id, int):
+        raise ValueError('selection_id must be an integer')
+    return betting.place_bet(current_user.id, amount_cents, selection_id, item.get('odds_version'))
+
+
+def bet_error(e):
+    if isinstance(e, odds.OddsChanged):
+        return 'The odds have changed', 409
+    if isinstance(e, ledger.InsufficientFunds):
+        return 'Insufficient balance', 409
+    if isinstance(e, risk.LimitExceeded):
+        return 'The selection has reached its limit', 409
+    if isinstance(e, LookupError):
+        return 'Selection is not open for betting', 409
+    return str(e), 400
+
+
+@bp.route('/bets', methods=['POST'])
+@ratelimit.limit('bet', '30/minute')
+@idempotency.idempotent
+def create_bet():
+    try:
+        bet = place(body())
+    except (ValueError, LookupError, odds.OddsChanged, risk.LimitExceeded, ledger.InsufficientFunds) as e:
+        db.session.rollback()
+        return error(*bet_error(e))
+    db.session.commit()
+    return jsonify(bet=bet.to_dict(), balance=balance(current_user.id)), 201
+
+
+@bp.route('/bets/batch', methods=['POST'])
+@ratelimit.limit('bet', '30/minute')
+@idempotency.idempotent
+def create_bets():
+    """Place up to MAX_BATCH_BETS bets in one transaction: either all are accepted or none."""
+    items = body().get('bets')
+    if not isinstance(items, list) or not items:
+        return error('bets must be a non-empty list', 400)
+    if len(items) > MAX_BATCH_BETS:
+        return error(f'At most {MAX_BATCH_BETS} bets per batch', 400)
+    bets = []
+    for index, item in enumerate(items):
+        try:
+            bets.append(place(item if isinstance(item, dict) else {}))
+        except (ValueError, LookupError, odds.OddsChanged, risk.LimitExceeded, ledger.InsufficientFunds) as e:
+            db.session.rollback()
+            message, status = bet_error(e)
+            return jsonify(error=message, index=index), status
+    db.session.commit()
+    return jsonify(bets=[bet.to_dict() for bet in bets], balance=balance(current_user.id)), 201
+
+
+def slip_request(data):
+    """Parse ``{"system", "stake", "legs": [{"selection_id", "odds_version"}]}``."""
+    try:
+        stake_cents = to_cents(data.get('stake'))
+    except ValueError:
+        raise ValueError('Invalid stake')
+    legs = data.get('legs')
+    if not isinstance(legs, list) or not all(isinstance(leg, dict) for leg in legs):
+        raise ValueError('legs must be a list of objects')
+    if not all(isinstance(leg.get('selection_id'), int) for leg in legs):
+        raise ValueError('selection_id must be an integer')
+    return (str(data.get('system', 'accumulator')).lower(), stake_cents,
+            [(leg['selection_id'], leg.get('odds_version')) for leg in legs])
+
+
+@bp.route('/slips/quote', methods=['POST'])
+def quote_slip():
+    try:
+        system, stake_cents, legs = slip_request(body())
+        prices = [odds.quote(selection_id).odds for selection_id, _ in legs]
+        combinations, total_stake_cents, potential_cents = slips.price(stake_cents, prices, system)
+    except (ValueError, LookupError) as e:
+        return error(*bet_error(e))
+    return jsonify(combinations=combinations, total_stake=str(from_cents(total_stake_cents)),
+                   potential_return=str(from_cents(potential_cents)))
+
+
+@bp.route('/slips', methods=['POST'])
+@ratelimit.limit('bet', '30/minute')
+@idempotency.idempotent
+def create_slip():
+    try:
+        system, stake_cents, legs = slip_request(body())
+        slip = slips.place(current_user.id, stake_cents, legs, system)
+    except (ValueError, LookupError, odds.OddsChanged, risk.LimitExceeded, ledger.InsufficientFunds) as e:
+        db.session.rollback()
+        return error(*bet_error(e))
+    db.session.commit()
+    return jsonify(slip=slip.to_dict(), balance=balance(current_user.id)), 201
+
+
+@bp.route('/slips')
+@storage.read_only
+def list_slips():
+    _, order, cursor, limit = history.page_args(request.args)
+    user_slips, next_cursor = history.keyset_page(BetSlip.query.filter(BetSlip.user_id == current_user.id),
+                                                  BetSlip, order, cursor, limit)
+    return jsonify(slips=[slip.to_dict() for slip in user_slips], next_cursor=next_cursor)
+
+
+@bp.route('/transactions')
+@storage.read_only
+def list_transactions():
+    _, order, cursor, limit = history.page_args(request.args)
+    transactions, next_cursor = history.transaction_page(current_user.id, order, cursor, limit)
+    return jsonify(transactions=[transaction.to_dict() for transaction in transactions], next_cursor=next_cursor)
+
+
+@bp.route('/deposits', methods=['POST'])
+@ratelimit.limit('wallet', '10/minute')
+@idempotency.idempotent
+def create_deposit():
+    try:
+        amount_cents = to_cents(body().get('amount'))
+    except ValueError:
+        return error('Invalid amount', 400)
+    transaction = betting.deposit(current_user.id, amount_cents)
+    db.session.commit()
+    return jsonify(transaction=transaction.to_dict(), balance=balance(current_user.id)), 201
+
+
+@bp.route('/withdrawals', methods=['POST'])
+@ratelimit.limit('wallet', '10/minute')
+@idempotency.idempotent
+def create_withdrawal():
+    try:
+        amount_cents = to_cents(body().get('amount'))
+    except ValueError:
+        return error('Invalid amount', 400)
+    try:
+        transaction = betting.withdraw(current_user.id, amount_cents)
+    except ledger.InsufficientFunds:
+        db.session.rollback()
+        return error('Insufficient balance', 409)
+    db.session.commit()
+    # Accepted: the payout itself is made by the withdrawal workers
+    return jsonify(transaction=transaction.to_dict(), balance=balance(current_user.id)), 202
+
+
+def init_app(app):
+    identity.login_manager.request_loader(load_user_from_request)
+    app.register_blueprint(bp)
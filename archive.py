@@ -0,0 +1,96 @@
+"""Moving settled history out of the hot tables.
+
+``flask archive`` moves bets that are settled and transactions that are
+completed or failed, once older than ``ARCHIVE_AFTER_DAYS``, into
+``bet_archive`` and ``transaction_archive``. The rows keep their ids, so
+ledger references such as ``bet:12`` still resolve; a withdrawal's payout job
+is folded into its archived row as ``payout_reference``. What is left in
+``bet`` and ``transaction`` is the recent and the still open history, which is
+what settlement, the dashboard and the first history pages read.
+
+:mod:`history` and :mod:`export` read both tables, touching the archive only
+when a page reaches back past the newest archived row of the user.
+
+Deleted rows leave free pages behind. Databases created since the
+``auto_vacuum=INCREMENTAL`` pragma (see :mod:`storage`) hand them back to the
+filesystem with :func:`vacuum`; ``--vacuum-full`` rewrites an older database
+once, which also switches it to incremental mode.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, delete, func
+
+from models import db, Bet, ArchivedBet, Transaction, ArchivedTransaction, PayoutJob
+
+DEFAULT_AFTER_DAYS = 90
+DEFAULT_BATCH_SIZE = 5000
+
+ARCHIVES = {Bet: ArchivedBet, Transaction: ArchivedTransaction}
+
+
+def archivable(model, cutoff):
+    if model is Bet:
+        return Bet.result != 'Pending', Bet.created_at < cutoff
+    return Transaction.status.in_(['Completed', 'Failed']), Transaction.created_at < cutoff
+
+
+def copy_rows(model, ids):
+    columns = [column.name for column in model.__table__.columns]
+    rows = select(*model.__table__.columns).where(model.id.in_(ids))
+    if model is Transaction:
+        rows = rows.add_columns(PayoutJob.provider_reference).outerjoin(
+            PayoutJob, PayoutJob.transaction_id == Transaction.id)
+        columns.append('payout_reference')
+    db.session.execute(insert(ARCHIVES[model]).from_select(columns, rows))
+    if model is Transaction:
+        db.session.execute(delete(PayoutJob).where(PayoutJob.transaction_id.in_(ids)))
+    db.session.execute(delete(model).where(model.id.in_(ids)))
+
+
+def move(model, cutoff, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Archive the rows of ``model`` (``Bet`` or ``Transaction``) older than ``cutoff``, one commit per batch."""
+    # The newest row always stays: SQLite hands out max(id) + 1, which would reuse archived ids
+    newest_id = db.session.scalar(select(func.max(model.id)))
+    moved, last_id = 0, 0
+    if newest_id is None:
+        return moved
+    while True:
+        ids = db.session.scalars(
+            select(model.id).where(*archivable(model, cutoff), model.id > last_id, model.id < newest_id)
+            .order_by(model.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return moved
+        copy_rows(model, ids)
+        db.session.commit()
+        moved += len(ids)
+        last_id = ids[-1]
+        if progress:
+            progress(model, moved)
+
+
+def run(after_days=DEFAULT_AFTER_DAYS, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Archive bets and transactions older than ``after_days``; returns ``{model: rows moved}``."""
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    return {model: move(model, cutoff, batch_size, progress) for model in ARCHIVES}
+
+
+def vacuum(full=False):
+    """Return free pages to the filesystem (SQLite only); returns the bytes freed, or None elsewhere."""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return None
+    with engine.connect() as connection:
+        sqlite = connection.connection.driver_connection
+
+        def pragma(name):
+            return sqlite.execute(f'PRAGMA {name}').fetchone()[0]
+
+        page_size, before = pragma('page_size'), pragma('page_count')
+        # executescript runs outside a transaction and steps incremental_vacuum to the end
+        # (a plain execute frees a single page)
+        if full:
+            sqlite.executescript('VACUUM')
+        elif pragma('auto_vacuum') == 2:  # INCREMENTAL
+            sqlite.executescript('PRAGMA incremental_vacuum')
+        return (before - pragma('page_count')) * page_size
@@ -0,0 +1,271 @@
+"""Stylesheets and scripts, built into content-hashed, precompressed files.
+
+Sources live in ``assets/``: ``css/`` and ``js/`` are ours, ``vendor/`` holds
+the third-party files in :data:`VENDOR` (downloaded on the first build if they
+are missing). :data:`BUNDLES` lists the files each page asks for and what goes
+into them. ``flask build-assets`` writes every bundle to ``assets/build/``:
+
+* Tailwind is purged of every rule whose classes the templates and scripts
+  never mention, which takes it from megabytes to a few kilobytes, and the
+  CSS is minified.
+* Each file is named after a hash of its content (``app.3f9c2a1b7d4e.css``)
+  and written next to ``.gz`` and ``.br`` copies, so it is compressed once at
+  build time rather than on every request.
+* ``manifest.json`` maps bundle names to the hashed files.
+
+Templates link bundles with ``{{ stylesheet('app.css') }}`` and
+``{{ script('home.js') }}``. Built files are served from ``/assets/`` in the
+best encoding the client accepts, cached for a year as immutable; a new build
+changes the names. Until a build exists the same tags point at the sources
+and the vendor CDN, so a fresh checkout works without the build step.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import urllib.request
+
+from flask import Blueprint, current_app, request, send_from_directory, url_for, abort
+from markupsafe import Markup
+from werkzeug.local import LocalProxy
+
+VENDOR = {
+    'tailwind.css': 'https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css',
+}
+
+BUNDLES = {
+    'app.css': ['vendor/tailwind.css', 'css/app.css'],
+    'home.js': ['js/home.js'],
+    'dashboard.js': ['js/dashboard.js'],
+    'bet-history.js': ['js/bet-history.js'],
+    'wallet.js': ['js/wallet.js'],
+}
+
+IMMUTABLE_MAX_AGE = 365 * 86400
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+COMMENT = re.compile(r'/\*.*?\*/', re.S)
+LICENSE = re.compile(r'/\*!.*?\*/', re.S)
+CLASS_NAME = re.compile(r'\.((?:\\[0-9a-fA-F]{1,6}\s?|\\.|[\w-])+)')
+ESCAPE = re.compile(r'\\([0-9a-fA-F]{1,6}\s?|.)')
+TOKEN = re.compile(r'[\w:/.\-]+')
+
+bp = Blueprint('assets', __name__, url_prefix='/assets')
+
+
+def css_blocks(css):
+    """Split a stylesheet into ``(prelude, body)`` pairs; statements like ``@import`` have a body of None."""
+    blocks, start, depth, brace, quote = [], 0, 0, 0, None
+    for position, char in enumerate(css):
+        if quote:
+            if char == quote and css[position - 1] != '\\':
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '{':
+            if depth == 0:
+                brace = position
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                blocks.append((css[start:brace].strip(), css[brace + 1:position].strip()))
+                start = position + 1
+        elif char == ';' and depth == 0:
+            blocks.append((css[start:position].strip(), None))
+            start = position + 1
+    return blocks
+
+
+def split_selectors(prelude):
+    selectors, start, depth = [], 0, 0
+    for position, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:position].strip())
+            start = position + 1
+    selectors.append(prelude[start:].strip())
+    return selectors
+
+
+def unescape(name):
+    def replace(match):
+        escaped = match.group(1)
+        if len(escaped) > 1 or escaped in '0123456789abcdefABCDEF':
+            return chr(int(escaped.strip(), 16))
+        return escaped
+    return ESCAPE.sub(replace, name)
+
+
+def selector_classes(selector):
+    return {unescape(name) for name in CLASS_NAME.findall(selector)}
+
+
+def compact(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def compact_declarations(body):
+    return re.sub(r'\s*([;:,])\s*', r'\1', compact(body)).rstrip(';')
+
+
+def minify_css(css, used=None):
+    """Reserialize ``css`` compactly; with ``used``, drop rules needing a class not in it."""
+    output = []
+    for prelude, body in css_blocks(COMMENT.sub('', css)):
+        prelude = compact(prelude)
+        if body is None:
+            output.append(prelude + ';')
+        elif prelude.startswith(('@media', '@supports')):
+            inner = minify_css(body, used)
+            if inner:
+                output.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            output.append(f'{prelude}{{{compact_declarations(body)}}}')
+        else:
+            selectors = split_selectors(prelude)
+            if used is not None:
+                selectors = [selector for selector in selectors if selector_classes(selector) <= used]
+            if selectors:
+                output.append(f'{",".join(selectors)}{{{compact_declarations(body)}}}')
+    return ''.join(output)
+
+
+def used_tokens(*directories):
+    """Every class-like word in the templates and scripts: what a purge must keep."""
+    tokens = set()
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(('.html', '.js')):
+                    with open(os.path.join(root, name), encoding='utf-8') as f:
+                        tokens.update(TOKEN.findall(f.read()))
+    return tokens
+
+
+def read_source(source_dir, part):
+    path = os.path.join(source_dir, part)
+    if not os.path.exists(path) and part.startswith('vendor/'):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with urllib.request.urlopen(VENDOR[part[len('vendor/'):]], timeout=30) as response:
+            data = response.read()
+        with open(path, 'wb') as f:
+            f.write(data)
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def write(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def build(source_dir, build_dir, template_dir):
+    """Build every bundle into ``build_dir`` and return ``{name: (filename, sizes)}``.
+
+    ``sizes`` are the byte counts of the sources, the built file and its gzip
+    and brotli copies.
+    """
+    import brotli
+
+    os.makedirs(build_dir, exist_ok=True)
+    used = used_tokens(template_dir, os.path.join(source_dir, 'js'))
+    results = {}
+    for name, parts in BUNDLES.items():
+        sources = [read_source(source_dir, part) for part in parts]
+        source_size = sum(len(text.encode()) for text in sources)
+        if name.endswith('.css'):
+            # License comments are kept, everything else is purged (vendor files only) and minified
+            sources = [''.join(LICENSE.findall(text)) + minify_css(text, used if part.startswith('vendor/') else None)
+                       for part, text in zip(parts, sources)]
+        data = '\n'.join(sources).encode()
+        stem, extension = os.path.splitext(name)
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+        brotlied = brotli.compress(data, quality=11)
+        write(os.path.join(build_dir, filename), data)
+        write(os.path.join(build_dir, filename + '.gz'), gzipped)
+        write(os.path.join(build_dir, filename + '.br'), brotlied)
+        results[name] = (filename, (source_size, len(data), len(gzipped), len(brotlied)))
+    # Written last, so workers never see a manifest naming files that are not there yet
+    write(os.path.join(build_dir, 'manifest.json'),
+          json.dumps({name: filename for name, (filename, _) in results.items()}, indent=2).encode())
+    return results
+
+
+class AssetManifest:
+    def __init__(self):
+        self.source_dir = None
+        self.build_dir = None
+        self.names = {}
+        self.files = set()
+
+    def init_app(self, app):
+        self.source_dir = app.config.setdefault('ASSETS_SOURCE_DIR', os.path.join(app.root_path, 'assets'))
+        self.build_dir = app.config.setdefault('ASSETS_BUILD_DIR', os.path.join(self.source_dir, 'build'))
+        self.load()
+
+    def load(self):
+        try:
+            with open(os.path.join(self.build_dir, 'manifest.json')) as f:
+                self.names = json.load(f)
+        except FileNotFoundError:
+            self.names = {}
+        self.files = set(os.listdir(self.build_dir)) - {'manifest.json'} if self.names else set()
+
+    def urls(self, name):
+        """URLs to load bundle ``name``: the built file, or its sources before a build."""
+        if name in self.names:
+            return [url_for('assets.serve', filename=self.names[name])]
+        urls = []
+        for part in BUNDLES[name]:
+            if part.startswith('vendor/'):
+                urls.append(VENDOR[part[len('vendor/'):]])
+            else:
+                urls.append(url_for('assets.serve', filename=part))
+        return urls
+
+
+manifest = LocalProxy(lambda: current_app.extensions['assets.manifest'])
+
+
+def stylesheet(name):
+    return Markup(''.join(f'<link href="{url}" rel="stylesheet">' for url in manifest.urls(name)))
+
+
+def script(name):
+    return Markup(''.join(f'<script src="{url}" defer></script>' for url in manifest.urls(name)))
+
+
+@bp.route('/<path:filename>')
+def serve(filename):
+    if filename not in manifest.files:
+        # Sources are only linked before a build; they are revalidated on every use
+        if filename.startswith(('css/', 'js/')):
+            return send_from_directory(manifest.source_dir, filename, max_age=0)
+        abort(404)
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and filename + suffix in manifest.files:
+            response = send_from_directory(manifest.build_dir, filename + suffix, max_age=IMMUTABLE_MAX_AGE,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(manifest.build_dir, filename, max_age=IMMUTABLE_MAX_AGE)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    manifest = app.extensions['assets.manifest'] = AssetManifest()
+    manifest.init_app(app)
+    app.jinja_env.globals.update(stylesheet=stylesheet, script=script)
+    app.register_blueprint(bp)
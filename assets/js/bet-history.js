@@ -0,0 +1,79 @@
+// Pages are fetched from the server one at a time; the browser only keeps
+// the cursors of the pages already visited so Previous can step back.
+const settings = document.getElementById('history').dataset;
+const pageUrl = settings.pageUrl;
+const pageSize = settings.pageSize;
+let cursors = [JSON.parse(settings.cursor)];
+let nextCursor = JSON.parse(settings.nextCursor);
+
+function resultClass(result) {
+    const value = (result || '').toLowerCase();
+    return value === 'win' ? 'bg-green-500 text-white' : value === 'lose' ? 'bg-red-500 text-white' : 'bg-yellow-400 text-white';
+}
+
+function cell(text) {
+    const td = document.createElement('td');
+    td.className = 'border px-4 py-2';
+    td.textContent = text;
+    return td;
+}
+
+// Function to render the table
+function renderTable(bets) {
+    const tableBody = document.getElementById('betTable');
+    tableBody.innerHTML = '';
+    bets.forEach(bet => {
+        const row = document.createElement('tr');
+        row.appendChild(cell(bet.id));
+        row.appendChild(cell('$' + bet.amount));
+        row.appendChild(cell(bet.prediction));
+        const badge = document.createElement('span');
+        badge.className = 'py-1 px-3 rounded-full ' + resultClass(bet.result);
+        badge.textContent = bet.result;
+        const resultCell = cell('');
+        resultCell.appendChild(badge);
+        row.appendChild(resultCell);
+        row.appendChild(cell(bet.created_at));
+        tableBody.appendChild(row);
+    });
+}
+
+function loadPage(cursor) {
+    const params = new URLSearchParams({
+        result: document.getElementById('filter').value,
+        order: document.getElementById('sort').value,
+        limit: pageSize,
+    });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return fetch(pageUrl + '?' + params.toString(), {credentials: 'same-origin'})
+        .then(response => response.json())
+        .then(page => {
+            renderTable(page.bets);
+            nextCursor = page.next_cursor;
+            document.getElementById('nextBtn').classList.toggle('opacity-50', !nextCursor);
+        });
+}
+
+// Filter or sort changes restart from the first page
+function resetPages() {
+    cursors = [null];
+    loadPage(null);
+}
+
+// Pagination functions
+function nextPage() {
+    if (nextCursor) {
+        cursors.push(nextCursor);
+        loadPage(nextCursor);
+    }
+    return false;
+}
+
+function prevPage() {
+    if (cursors.length > 1) {
+        cursors.pop();
+        loadPage(cursors[cursors.length - 1]);
+    }
+}
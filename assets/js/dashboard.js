@@ -0,0 +1,13 @@
+function syncOddsVersion() {
+    const select = document.getElementById('selection_id');
+    const option = select.options[select.selectedIndex];
+    document.getElementById('odds_version').value = option ? option.dataset.version : '';
+}
+syncOddsVersion();
+
+// The page may come from cache or a 304, so each view of it gets its own idempotency key here
+window.addEventListener('pageshow', function() {
+    const key = window.crypto && crypto.randomUUID ? crypto.randomUUID()
+        : Date.now().toString(36) + Math.random().toString(36).slice(2);
+    document.getElementById('idempotency_key').value = key;
+});
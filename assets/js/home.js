@@ -0,0 +1,39 @@
+// Mobile menu toggle
+document.getElementById('mobileMenuBtn').addEventListener('click', function() {
+    const mobileMenu = document.getElementById('mobileMenu');
+    mobileMenu.classList.toggle('hidden');
+});
+
+// Search filter functionality
+const searchBar = document.getElementById('searchBar');
+const betCards = document.querySelectorAll('.bet-card');
+
+searchBar.addEventListener('input', function() {
+    const filterValue = searchBar.value.toLowerCase();
+    betCards.forEach(card => {
+        const betText = card.textContent.toLowerCase();
+        if (betText.includes(filterValue)) {
+            card.style.display = '';
+        } else {
+            card.style.display = 'none';
+        }
+    });
+});
+
+// Live odds: the server pushes changed prices, so the page never polls
+if (window.EventSource && document.body.dataset.oddsStream) {
+    const stream = new EventSource(document.body.dataset.oddsStream);
+    stream.addEventListener('odds', function(event) {
+        JSON.parse(event.data).forEach(update => {
+            document.querySelectorAll(`.odds[data-selection="${update.id}"]`).forEach(span => {
+                if (update.closed) {
+                    span.textContent = 'closed';
+                    span.closest('p').classList.add('line-through', 'text-gray-500');
+                } else {
+                    span.textContent = update.odds;
+                }
+            });
+        });
+    });
+    stream.addEventListener('reload', () => window.location.reload());
+}
@@ -0,0 +1,34 @@
+// Client-side checks for the deposit and withdrawal forms
+function validateDeposit() {
+    const amount = document.getElementById('amount').value;
+    const errorMessage = document.getElementById('error-message');
+    const confirmationMessage = document.getElementById('confirmationMessage');
+
+    if (amount <= 0) {
+        errorMessage.classList.remove('hidden');
+        return false;
+    } else {
+        errorMessage.classList.add('hidden');
+        confirmationMessage.classList.remove('hidden');
+        return true;
+    }
+}
+
+function validateWithdrawal() {
+    const amount = document.getElementById('amount').value;
+    const balance = parseFloat(document.getElementById('withdrawForm').dataset.balance);
+    const errorMessage = document.getElementById('error-message');
+    const confirmationMessage = document.getElementById('confirmationMessage');
+
+    if (amount <= 0 || amount > balance) {
+        errorMessage.textContent = amount <= 0 
+            ? "Please enter a valid withdrawal amount." 
+            : "You cannot withdraw more than your current balance.";
+        errorMessage.classList.remove('hidden');
+        return false;
+    } else {
+        errorMessage.classList.add('hidden');
+        confirmationMessage.classList.remove('hidden');
+        return true;
+    }
+}
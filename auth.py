@@ -0,0 +1,93 @@
+"""Registration, login and logout."""
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask_login import login_user, login_required, logout_user
+
+from models import db, User, UserStats
+import passwords
+import ratelimit
+
+bp = Blueprint('auth', __name__)
+
+
+@bp.route('/register', methods=['GET', 'POST'])
+@ratelimit.limit('register', '5/minute', key=ratelimit.by_ip)
+def register():
+    if request.method == 'POST':
+        try:
+            username = request.form.get('username')
+            password = request.form.get('password')
+
+            passwords.register_throttle.check(('ip', request.remote_addr))
+            passwords.register_throttle.hit(('ip', request.remote_addr))
+
+            user = User.query.filter_by(username=username).first()
+            if user:
+                flash('Username already exists')
+                return redirect(url_for('auth.register'))
+
+            new_user = User(username=username, password=passwords.hasher.hash(password))
+            db.session.add(new_user)
+            db.session.flush()
+            db.session.add(UserStats(user_id=new_user.id))
+            db.session.commit()
+
+            flash('Registration successful. Please log in.')
+            return redirect(url_for('auth.login'))
+        except passwords.Throttled as e:
+            flash(f'Too many registrations, please try again in {e.retry_after} seconds.')
+            return render_template('register.html'), 429, {'Retry-After': str(e.retry_after)}
+        except passwords.HashingBusy:
+            flash('The server is busy, please try again in a moment.')
+            return render_template('register.html'), 503, {'Retry-After': '1'}
+        except Exception:
+            current_app.logger.exception('Error during registration')
+            flash('An error occurred during registration. Please try again.')
+            return redirect(url_for('auth.register'))
+
+    return render_template('register.html')
+
+
+@bp.route('/login', methods=['GET', 'POST'])
+@ratelimit.limit('login', '20/minute', key=ratelimit.by_ip)
+def login():
+    if request.method == 'POST':
+        username = request.form.get('username')
+        password = request.form.get('password')
+        ip_key, user_key = ('ip', request.remote_addr), ('user', username)
+
+        try:
+            passwords.login_ip_throttle.check(ip_key)
+            passwords.login_user_throttle.check(user_key)
+            user = User.query.filter_by(username=username).first()
+            valid = passwords.hasher.verify(user.password if user else None, password)
+        except passwords.Throttled as e:
+            flash(f'Too many login attempts, please try again in {e.retry_after} seconds.')
+            return render_template('login.html'), 429, {'Retry-After': str(e.retry_after)}
+        except passwords.HashingBusy:
+            flash('The server is busy, please try again in a moment.')
+            return render_template('login.html'), 503, {'Retry-After': '1'}
+
+        if valid:
+            if passwords.hasher.needs_rehash(user.password):
+                # Upgrade hashes made with an older scheme while we have the plain password
+                try:
+                    user.password = passwords.hasher.hash(password)
+                    db.session.commit()
+                except passwords.HashingBusy:
+                    pass
+            passwords.login_user_throttle.reset(user_key)
+            login_user(user)
+            return redirect(url_for('web.dashboard'))
+        else:
+            passwords.login_ip_throttle.hit(ip_key)
+            passwords.login_user_throttle.hit(user_key)
+            flash('Invalid username or password')
+
+    return render_template('login.html')
+
+
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    return redirect(url_for('web.home'))
@@ -0,0 +1,6 @@
+"""Load-testing harness for the betting hot paths.
+
+Seeds a throwaway database in bulk and measures throughput and latency
+percentiles of the main endpoints, either in-process through the Flask test
+client or over HTTP against a running server. See ``python -m benchmarks --help``.
+"""
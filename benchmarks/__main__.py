@@ -0,0 +1,201 @@
+"""Command line entry point.
+
+In-process run against a fresh SQLite file::
+
+    python -m benchmarks run --users 200 --bets 100000 --out results.json
+
+Against a local gunicorn, seed the same database the server uses first::
+
+    DATABASE_URL=sqlite:////tmp/bench.db BETTINGKING_RATELIMIT_ENABLED=false gunicorn -w 4 wsgi:app &
+    python -m benchmarks run --database sqlite:////tmp/bench.db --url http://127.0.0.1:8000
+
+Compare two result files::
+
+    python -m benchmarks compare before.json after.json
+
+Hold thousands of odds streams open against one gevent worker started from
+``gunicorn.conf.py`` (``--worker-class sync`` for comparison)::
+
+    python -m benchmarks streams --connections 2000 --workers 1
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+SCENARIOS = ['login', 'place_bet', 'bet_history', 'transactions', 'update_bet_result']
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    # The app reads DATABASE_URL when it is created, so it has to be set first
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bettingking-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = database
+    from main import create_app
+    app = create_app({'RATELIMIT_ENABLED': False})
+    from benchmarks.seed import seed
+    from benchmarks.harness import TestClientDriver, HttpDriver, run_scenario
+
+    seeded = seed(app, users=args.users, bets=args.bets, transactions=args.transactions, events=args.events)
+    if args.url:
+        make_driver = lambda: HttpDriver(args.url)
+    else:
+        make_driver = lambda: TestClientDriver(app)
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(make_driver, seeded, name, args.requests, args.concurrency)
+        print(f'{name:>18}: {results[name]["throughput_rps"]} req/s  p50 {results[name]["p50_ms"]}ms  '
+              f'p95 {results[name]["p95_ms"]}ms  p99 {results[name]["p99_ms"]}ms  errors {results[name]["errors"]}',
+              file=sys.stderr)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'target': args.url or 'test-client',
+            'database': database,
+            'users': args.users,
+            'bets': args.bets,
+            'transactions': args.transactions,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+def streams(args):
+    from benchmarks.streams import raise_file_limit, free_port, serve, run_streams
+
+    raise_file_limit(args.connections)
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bettingking-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = database
+    from main import create_app
+    app = create_app({'RATELIMIT_ENABLED': False})
+    from benchmarks.seed import seed
+    import odds
+
+    seeded = seed(app, users=1, bets=0, transactions=0, events=args.events)
+
+    def reprice():
+        with app.app_context():
+            odds.set_odds(seeded.selections[0], 9.99)
+
+    server = None
+    url = args.url
+    if not url:
+        port = free_port()
+        server = serve(database, args.worker_class, args.workers, port)
+        url = f'http://127.0.0.1:{port}'
+    try:
+        result = run_streams(url, args.connections, args.hold, reprice, master_pid=server and server.pid)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    print(f'{result["connected"]}/{args.connections} streams open after {result["open_seconds"]}s, '
+          f'pages p50 {result["pages_while_held"]["p50_ms"]}ms p99 {result["pages_while_held"]["p99_ms"]}ms '
+          f'errors {result["pages_while_held"]["errors"]}, odds reached '
+          f'{(result["odds_fanout"] or {}).get("delivered", 0)} streams '
+          f'(p99 {(result["odds_fanout"] or {}).get("p99_ms")}ms)', file=sys.stderr)
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'target': args.url or f'gunicorn {args.worker_class} x{args.workers}',
+            'database': database,
+            'connections': args.connections,
+            'hold': args.hold,
+        },
+        'results': {'streams': result},
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f'{"scenario":>18}  {"metric":>14}  {before["meta"]["revision"] or "before":>10}  '
+          f'{after["meta"]["revision"] or "after":>10}  change')
+    for name, stats in after['results'].items():
+        old = before['results'].get(name)
+        if not old:
+            continue
+        for metric in ['throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms']:
+            if old.get(metric) and stats.get(metric) is not None:
+                change = (stats[metric] - old[metric]) / old[metric] * 100
+                print(f'{name:>18}  {metric:>14}  {old[metric]:>10}  {stats[metric]:>10}  {change:+.1f}%')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='seed a database and benchmark the endpoints')
+    run_parser.add_argument('--users', type=int, default=100)
+    run_parser.add_argument('--bets', type=int, default=20000)
+    run_parser.add_argument('--transactions', type=int, default=10000)
+    run_parser.add_argument('--events', type=int, default=20)
+    run_parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='client threads')
+    run_parser.add_argument('--scenarios', type=lambda value: value.split(','), default=SCENARIOS,
+                            help=f'comma separated subset of {",".join(SCENARIOS)}')
+    run_parser.add_argument('--database', help='SQLAlchemy URL to seed (default: a temporary SQLite file)')
+    run_parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    run_parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    run_parser.set_defaults(handler=run)
+
+    streams_parser = commands.add_parser('streams', help='hold many odds streams open against gunicorn')
+    streams_parser.add_argument('--connections', type=int, default=2000)
+    streams_parser.add_argument('--hold', type=float, default=10.0,
+                                help='seconds to hold the streams open while timing page loads')
+    streams_parser.add_argument('--worker-class', default='gevent', help='gunicorn worker class to start')
+    streams_parser.add_argument('--workers', type=int, default=1)
+    streams_parser.add_argument('--events', type=int, default=20)
+    streams_parser.add_argument('--database', help='SQLAlchemy URL to seed (default: a temporary SQLite file)')
+    streams_parser.add_argument('--url', help='use a running server (seeded from --database) instead')
+    streams_parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    streams_parser.set_defaults(handler=streams)
+
+    compare_parser = commands.add_parser('compare', help='compare two JSON reports')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
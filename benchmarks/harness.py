@@ -0,0 +1,158 @@
+"""Request drivers, scenarios and latency statistics."""
+import http.cookiejar
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from itertools import count
+
+from benchmarks.seed import BENCH_PASSWORD
+
+
+class TestClientDriver:
+    """Drives the app in-process through the Flask test client."""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    def login(self, user):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data=data).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    """Drives a running server, e.g. a local gunicorn, over HTTP."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def login(self, user):
+        self.post('/login', {'username': user.username, 'password': BENCH_PASSWORD})
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data):
+        body = urllib.parse.urlencode(data).encode()
+        return self._open(urllib.request.Request(self.base_url + path, data=body))
+
+
+def scenarios(seeded):
+    """Map of scenario name to ``(who logs in, request(driver, i))``."""
+    pending = iter(seeded.pending_bets)
+    pending_lock = threading.Lock()
+
+    def next_pending():
+        with pending_lock:
+            return next(pending, None)
+
+    def login(driver, i):
+        user = seeded.users[i % len(seeded.users)]
+        return driver.post('/login', {'username': user.username, 'password': BENCH_PASSWORD})
+
+    def place_bet(driver, i):
+        selection = seeded.selections[i % len(seeded.selections)]
+        return driver.post('/place_bet', {'amount': '1.00', 'selection_id': selection})
+
+    def update_bet_result(driver, i):
+        bet_id = next_pending()
+        if bet_id is None:
+            return None
+        return driver.post(f'/update_bet_result/{bet_id}', {'result': 'Win' if i % 2 else 'Lose'})
+
+    return {
+        'login': ('anonymous', login),
+        'place_bet': ('user', place_bet),
+        'bet_history': ('user', lambda driver, i: driver.get('/bet_history')),
+        'transactions': ('user', lambda driver, i: driver.get('/transactions')),
+        'update_bet_result': ('admin', update_bet_result),
+    }
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(ordered) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else None,
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p95_ms': ms(percentile(ordered, 0.95)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+        'max_ms': ms(ordered[-1]) if ordered else None,
+    }
+
+
+def run_scenario(make_driver, seeded, name, requests, concurrency, warmup=10):
+    """Issue ``requests`` calls of scenario ``name`` from ``concurrency`` threads."""
+    who, call = scenarios(seeded)[name]
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    counter = count()
+    ready = threading.Barrier(concurrency + 1)
+
+    def worker(index):
+        driver = make_driver()
+        if who == 'user':
+            driver.login(seeded.users[index % len(seeded.users)])
+        elif who == 'admin':
+            driver.login(seeded.admin)
+        for _ in range(warmup if name != 'update_bet_result' else 0):
+            call(driver, index)
+        ready.wait()
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            start = time.perf_counter()
+            status = call(driver, i)
+            took = time.perf_counter() - start
+            if status is None:
+                return
+            with lock:
+                latencies.append(took)
+                if status >= 400:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
@@ -0,0 +1,73 @@
+"""Bulk seeding of users, events, bets and transactions for benchmarks."""
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from models import db, User, Bet, Transaction, Selection
+import odds
+import passwords
+
+BENCH_PASSWORD = 'bench-password'
+SPORTS = ['Soccer', 'Basketball', 'Tennis', 'Cricket']
+
+Seeded = namedtuple('Seeded', 'users admin selections pending_bets')
+
+
+def seed(app, users=100, bets=10000, transactions=5000, events=20, batch_size=5000, rng_seed=0):
+    """Reset the database and fill it; returns the ids the scenarios need."""
+    rng = random.Random(rng_seed)
+    now = datetime.utcnow()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        password = passwords.hasher.hash(BENCH_PASSWORD)
+        db.session.execute(insert(User), [
+            dict(username=f'bench{i}', password=password, balance_cents=10 ** 12, is_admin=(i == 0))
+            for i in range(users + 1)
+        ])
+        user_rows = db.session.execute(select(User.id, User.username).order_by(User.id)).all()
+        admin, user_rows = user_rows[0], user_rows[1:]
+
+        for i in range(events):
+            sport = SPORTS[i % len(SPORTS)]
+            odds.create_event(f'{sport}: Team {2 * i} vs Team {2 * i + 1}', {
+                f'Team {2 * i}': round(rng.uniform(1.2, 4.0), 2),
+                f'Team {2 * i + 1}': round(rng.uniform(1.2, 4.0), 2),
+            }, sport=sport)
+        selections = db.session.execute(select(Selection.id, Selection.name, Selection.odds)).all()
+
+        user_ids = [row.id for row in user_rows]
+        rows = []
+        for i in range(bets):
+            selection = rng.choice(selections)
+            rows.append(dict(
+                user_id=rng.choice(user_ids), amount_cents=rng.randint(100, 10000),
+                prediction=selection.name, selection_id=selection.id, odds=selection.odds, odds_version=1,
+                result=rng.choice(['Win', 'Lose', 'Lose', 'Pending']),
+                created_at=now - timedelta(seconds=rng.randint(0, 365 * 86400)),
+            ))
+            if len(rows) >= batch_size:
+                db.session.execute(insert(Bet), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(Bet), rows)
+
+        rows = []
+        for i in range(transactions):
+            rows.append(dict(
+                user_id=rng.choice(user_ids), amount_cents=rng.randint(1000, 100000),
+                type=rng.choice(['deposit', 'withdrawal']), status='Completed',
+                created_at=now - timedelta(seconds=rng.randint(0, 365 * 86400)),
+            ))
+            if len(rows) >= batch_size:
+                db.session.execute(insert(Transaction), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(Transaction), rows)
+        db.session.commit()
+
+        pending = db.session.scalars(select(Bet.id).where(Bet.result == 'Pending').order_by(Bet.id)).all()
+        return Seeded(user_rows, admin, [row.id for row in selections], pending)
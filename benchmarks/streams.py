@@ -0,0 +1,204 @@
+"""Thousands of open ``/odds/stream`` clients against gunicorn.
+
+Event streams are opened from one thread with non-blocking sockets and held
+open while ordinary page loads are timed from another; then a selection is
+repriced and the time until the change reaches every stream is measured. With
+the gevent workers of ``gunicorn.conf.py`` a single process holds them all and
+keeps serving pages; with sync workers each stream takes a whole worker.
+"""
+import os
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+
+from benchmarks.harness import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKERS = (b'event: hello', b'event: odds')
+
+
+class Stream:
+    def __init__(self, sock):
+        self.sock = sock
+        self.tail = b''  # end of the last read, in case a marker straddles two reads
+        self.opened_at = time.perf_counter()
+        self.hello_at = None
+        self.odds_at = None
+        self.closed = False
+
+
+class StreamClients:
+    """Event stream connections multiplexed over one selector."""
+
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.request = f'GET /odds/stream HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n'.encode()
+        self.selector = selectors.DefaultSelector()
+        self.streams = []
+
+    def open(self, count):
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            sock.connect_ex(self.address)
+            stream = Stream(sock)
+            self.streams.append(stream)
+            self.selector.register(sock, selectors.EVENT_WRITE, stream)
+
+    def close(self, stream):
+        if not stream.closed:
+            stream.closed = True
+            self.selector.unregister(stream.sock)
+            stream.sock.close()
+
+    def poll(self, until, done=lambda: False):
+        while time.perf_counter() < until and not done():
+            for key, mask in self.selector.select(timeout=0.05):
+                stream = key.data
+                if mask & selectors.EVENT_WRITE:
+                    try:
+                        stream.sock.send(self.request)
+                    except OSError:
+                        self.close(stream)
+                        continue
+                    self.selector.modify(stream.sock, selectors.EVENT_READ, stream)
+                    continue
+                try:
+                    data = stream.sock.recv(65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b''
+                if not data:
+                    self.close(stream)
+                    continue
+                now = time.perf_counter()
+                seen = stream.tail + data
+                if stream.hello_at is None and MARKERS[0] in seen:
+                    stream.hello_at = now
+                if stream.odds_at is None and MARKERS[1] in seen:
+                    stream.odds_at = now
+                stream.tail = seen[-len(MARKERS[0]):]
+
+    def connected(self):
+        return [stream for stream in self.streams if stream.hello_at is not None and not stream.closed]
+
+    def shutdown(self):
+        for stream in self.streams:
+            self.close(stream)
+        self.selector.close()
+
+
+def time_pages(base_url, until, timeout):
+    """Load the home page back to back until ``until``; returns ``(latencies, errors)``."""
+    latencies, errors = [], 0
+    while time.perf_counter() < until:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base_url + '/', timeout=timeout) as response:
+                response.read()
+            latencies.append(time.perf_counter() - started)
+        except (urllib.error.URLError, OSError):
+            errors += 1
+    return latencies, errors
+
+
+def raise_file_limit(connections):
+    """Raise the open file limit for ``connections`` sockets (a server started afterwards inherits it)."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = connections + 256
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def serve(database, worker_class, workers, port, wait=30):
+    """Start gunicorn with ``gunicorn.conf.py`` on a free local port and wait until it accepts."""
+    env = dict(os.environ, DATABASE_URL=database, GUNICORN_WORKER_CLASS=worker_class,
+               GUNICORN_WORKERS=str(workers), GUNICORN_BIND=f'127.0.0.1:{port}',
+               BETTINGKING_RATELIMIT_ENABLED='false',
+               # Streams are switched off for sync workers; here the point is to see what they cost
+               BETTINGKING_ODDS_STREAM_ENABLED='true')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'wsgi:app'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {server.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start listening')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def worker_rss_kb(master_pid):
+    """Resident memory of each worker process of a gunicorn master (Linux only)."""
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            pids = f.read().split()
+        sizes = []
+        for pid in pids:
+            with open(f'/proc/{pid}/status') as f:
+                sizes += [int(line.split()[1]) for line in f if line.startswith('VmRSS:')]
+        return sizes
+    except OSError:
+        return None
+
+
+def run_streams(url, connections, hold, reprice=None, open_timeout=30, master_pid=None):
+    """Open ``connections`` streams against ``url``, hold them ``hold`` seconds, then call ``reprice()``."""
+    parts = urlsplit(url)
+    clients = StreamClients(parts.hostname, parts.port or 80)
+    started = time.perf_counter()
+    clients.open(connections)
+    clients.poll(started + open_timeout, done=lambda: len(clients.connected()) >= connections)
+    opened = time.perf_counter() - started
+
+    # Page loads while every stream is held open: a worker tied up by streams shows here
+    pages = []
+    until = time.perf_counter() + hold
+    thread = threading.Thread(target=lambda: pages.append(time_pages(url, until, timeout=hold)))
+    thread.start()
+    clients.poll(until)
+    thread.join()
+    latencies, errors = pages[0] if pages else ([], 0)
+    memory = worker_rss_kb(master_pid) if master_pid else None
+
+    fanout = None
+    connected = clients.connected()
+    if reprice and connected:
+        repriced_at = time.perf_counter()
+        reprice()
+        clients.poll(repriced_at + 30, done=lambda: all(stream.odds_at for stream in connected))
+        delays = [stream.odds_at - repriced_at for stream in connected if stream.odds_at]
+        fanout = dict(summarize(delays, len(connected) - len(delays), time.perf_counter() - repriced_at),
+                      delivered=len(delays))
+
+    result = {
+        'connections': connections,
+        'connected': len(clients.connected()),
+        'open_seconds': round(opened, 3),
+        'time_to_hello': summarize([stream.hello_at - stream.opened_at for stream in connected], 0, opened),
+        'pages_while_held': summarize(latencies, errors, hold),
+        'odds_fanout': fanout,
+        'worker_rss_kb': memory,
+    }
+    clients.shutdown()
+    return result
@@ -0,0 +1,51 @@
+"""Bet placement and wallet operations shared by the HTML views and the API.
+
+These add rows and move money through the ledger inside the caller's
+transaction; they do not commit. Failures raise: ``LookupError`` for a closed
+selection, :class:`odds.OddsChanged` for a stale price,
+:class:`risk.LimitExceeded` when a selection has reached its liability limit
+and :class:`ledger.InsufficientFunds` when the balance does not cover a debit.
+"""
+from flask import current_app
+
+from models import db, Bet, Transaction
+from money import to_cents
+from settlement import payout_cents
+import ledger
+import odds
+import risk
+import user_stats
+import withdrawals
+
+
+def place_bet(user_id, amount_cents, selection_id, odds_version=None):
+    quote = odds.quote(selection_id, odds_version)
+    risk.reserve(quote.id, amount_cents, payout_cents(amount_cents, 'Win', quote.odds))
+    bet = Bet(user_id=user_id, amount_cents=amount_cents, prediction=quote.label,
+              selection_id=quote.id, odds=quote.odds, odds_version=quote.odds_version)
+    db.session.add(bet)
+    db.session.flush()
+    ledger.debit(user_id, amount_cents, 'stake', f'bet:{bet.id}', ledger.HOUSE_BETS)
+    user_stats.bump(user_id, bets_placed=1, total_staked_cents=amount_cents, open_exposure_cents=amount_cents)
+    return bet
+
+
+def deposit(user_id, amount_cents):
+    transaction = Transaction(user_id=user_id, amount_cents=amount_cents, type='deposit', status='Completed')
+    db.session.add(transaction)
+    db.session.flush()
+    ledger.credit(user_id, amount_cents, 'deposit', f'transaction:{transaction.id}')
+    user_stats.bump(user_id, total_deposited_cents=amount_cents)
+    return transaction
+
+
+def withdraw(user_id, amount_cents):
+    """Debit the balance and queue the payout (see :mod:`withdrawals`)."""
+    transaction = Transaction(user_id=user_id, amount_cents=amount_cents, type='withdrawal')
+    db.session.add(transaction)
+    db.session.flush()
+    ledger.debit(user_id, amount_cents, 'withdrawal', f'transaction:{transaction.id}')
+    user_stats.bump(user_id, total_withdrawn_cents=amount_cents)
+    threshold = current_app.config['WITHDRAWAL_APPROVAL_THRESHOLD']
+    withdrawals.enqueue(transaction, to_cents(threshold) if threshold is not None else None)
+    return transaction
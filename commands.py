@@ -0,0 +1,299 @@
+"""``flask`` commands for operators: schema, events and odds, settlement, workers."""
+import multiprocessing
+import os
+import time
+
+import click
+from flask import Blueprint, current_app
+
+from models import db, User, SettlementRun
+from money import to_cents, from_cents
+import api
+import archive
+import assets
+import export
+import idempotency
+import migrations
+import odds
+import reconcile
+import risk
+import settlement
+import user_stats
+import withdrawals
+
+# cli_group=None puts the commands at the top level: ``flask settle`` rather than ``flask commands settle``
+bp = Blueprint('commands', __name__, cli_group=None)
+
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """Create any missing tables and upgrade a database from an earlier version."""
+    migrations.upgrade(progress=click.echo)
+    click.echo('database initialised')
+
+
+@bp.cli.command('build-assets')
+def build_assets_command():
+    """Purge, hash and precompress the stylesheets and scripts into assets/build."""
+    try:
+        results = assets.build(assets.manifest.source_dir, assets.manifest.build_dir,
+                               os.path.join(current_app.root_path, current_app.template_folder))
+    except OSError as e:
+        raise click.ClickException(f'Could not build the assets: {e}')
+    for name, (filename, (source, built, gzipped, brotlied)) in results.items():
+        click.echo(f'{name}: {filename}  {source:,} bytes -> {built:,} ({gzipped:,} gzip, {brotlied:,} brotli)')
+
+
+@bp.cli.command('settle')
+@click.option('--outcome', 'outcomes', multiple=True, metavar='PREDICTION=RESULT',
+              help='Result for every pending bet on PREDICTION: Win, Lose or Void. Repeatable.')
+@click.option('--market', 'market_id', type=int, help='Settle a market by selection instead of by prediction.')
+@click.option('--winner', 'winners', type=int, multiple=True, help='Winning selection id of --market. Repeatable.')
+@click.option('--void', is_flag=True, help='Void every selection of --market and refund the stakes.')
+@click.option('--resume', 'run_id', type=int, help='Continue an interrupted settlement run.')
+@click.option('--chunk-size', default=settlement.DEFAULT_CHUNK_SIZE, show_default=True, type=click.IntRange(min=1))
+def settle_command(outcomes, market_id, winners, void, run_id, chunk_size):
+    """Settle all pending bets for an event outcome."""
+    if run_id:
+        run = db.session.get(SettlementRun, run_id)
+        if run is None:
+            raise click.ClickException(f'No settlement run {run_id}')
+    else:
+        try:
+            if market_id:
+                run = settlement.start_market_run(market_id, winners, void)
+            else:
+                run = settlement.start_run(dict(outcome.rsplit('=', 1) for outcome in outcomes))
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+    def progress(run):
+        click.echo(f'run {run.id}: {run.settled_count} bets settled, ${run.to_dict()["credited"]} credited, '
+                   f'up to bet {run.last_bet_id}')
+
+    settlement.settle(run, chunk_size, progress)
+    click.echo(f'run {run.id}: {run.status}')
+
+
+@bp.cli.command('add-event')
+@click.argument('name')
+@click.option('--price', 'prices', multiple=True, required=True, metavar='SELECTION=ODDS',
+              help='Selection and its decimal odds. Repeatable.')
+@click.option('--sport')
+@click.option('--market', 'market_name', default='Match Winner', show_default=True)
+@click.option('--featured', is_flag=True, help='Show the event under Favorites on the home page.')
+def add_event_command(name, prices, sport, market_name, featured):
+    """Open an event for betting."""
+    try:
+        prices = {selection: float(price) for selection, price in (item.rsplit('=', 1) for item in prices)}
+    except ValueError:
+        raise click.ClickException('Prices must look like SELECTION=ODDS')
+    event = odds.create_event(name, prices, sport=sport, featured=featured, market_name=market_name)
+    for market in event.markets:
+        for selection in market.selections:
+            click.echo(f'selection {selection.id}: {selection.name} @ {selection.odds}')
+
+
+@bp.cli.command('set-odds')
+@click.argument('selection_id', type=int)
+@click.argument('price', type=float)
+def set_odds_command(selection_id, price):
+    """Reprice a selection."""
+    try:
+        version = odds.set_odds(selection_id, price)
+    except (LookupError, ValueError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f'selection {selection_id} @ {price} (version {version})')
+
+
+@bp.cli.command('seed-events')
+def seed_events_command():
+    """Open the demo events shown on the home page."""
+    demo = [
+        ('Soccer: Team A vs Team B', 'Soccer', {'Team A': 1.5, 'Draw': 3.8, 'Team B': 4.2}, False),
+        ('Basketball: Team C vs Team D', 'Basketball', {'Team C': 2.0, 'Team D': 1.8}, False),
+        ('Tennis: Player X vs Player Y', 'Tennis', {'Player X': 1.8, 'Player Y': 2.0}, False),
+        ('Cricket: Team E vs Team F', 'Cricket', {'Team E': 1.7, 'Team F': 2.1}, False),
+        ('Soccer: Team G vs Team H', 'Soccer', {'Team G': 2.5, 'Draw': 3.1, 'Team H': 2.6}, True),
+    ]
+    for name, sport, prices, featured in demo:
+        odds.create_event(name, prices, sport=sport, featured=featured)
+    click.echo(f'{len(demo)} events opened')
+
+
+@bp.cli.command('export')
+@click.argument('kind', type=click.Choice(list(export.COLUMNS)))
+@click.option('--format', 'fmt', type=click.Choice(list(export.FORMATS)), default='csv', show_default=True)
+@click.option('--user', 'username', help='Only this user (default: everyone).')
+@click.option('--start', help='First day (or datetime) to include, ISO format.')
+@click.option('--end', help='Last day to include, or exclusive datetime, ISO format.')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='File to write (default: stdout).')
+def export_command(kind, fmt, username, start, end, compress, output):
+    """Stream bets or transactions as CSV or JSON Lines."""
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'No user {username}')
+        user_id = user.id
+    try:
+        start, end = export.parse_date(start), export.parse_date(end, end=True)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for chunk in export.stream(kind, fmt, user_id, start, end, compress):
+        output.write(chunk)
+
+
+@bp.cli.command('rebuild-stats')
+@click.option('--batch-size', default=user_stats.REBUILD_BATCH_SIZE, show_default=True, help='Users per transaction.')
+@click.option('--check', is_flag=True, help='Only compare the stored stats with the history; exit 1 on a difference.')
+def rebuild_stats_command(batch_size, check):
+    """Recompute every user's dashboard stats from the bet, slip and transaction history."""
+    if not check:
+        user_stats.rebuild(batch_size, progress=lambda last_id: click.echo(f'rebuilt stats up to user {last_id}'))
+        return
+    differing = 0
+    for user_id, stored, rebuilt in user_stats.check(batch_size):
+        differing += 1
+        changes = ', '.join(f'{field} {stored[field]} != {rebuilt[field]}'
+                            for field in user_stats.FIELDS if stored[field] != rebuilt[field])
+        click.echo(f'user {user_id}: {changes}')
+    if differing:
+        raise click.ClickException(f'{differing} users have stats that differ from their history')
+    click.echo('stats match the history')
+
+
+@bp.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """Delete idempotency keys older than IDEMPOTENCY_KEY_TTL."""
+    click.echo(f'{idempotency.purge()} idempotency keys purged')
+
+
+@bp.cli.command('create-api-token')
+@click.argument('username')
+@click.option('--name', help='Label to tell the token apart, e.g. the device.')
+def create_api_token_command(username, name):
+    """Issue a bearer token for the JSON API."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No user {username}')
+    token = api.issue_token(user.id, name)
+    db.session.commit()
+    click.echo(token)
+
+
+@bp.cli.command('set-limit')
+@click.argument('selection_id', type=int)
+@click.argument('limit', required=False)
+def set_limit_command(selection_id, limit):
+    """Cap the potential payout on a selection (omit LIMIT to remove the cap)."""
+    try:
+        risk.set_limit(selection_id, to_cents(limit) if limit else None)
+    except (LookupError, ValueError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f'selection {selection_id} limit: {limit or "none"}')
+
+
+@bp.cli.command('recompute-exposure')
+def recompute_exposure_command():
+    """Rebuild every selection's stake and liability totals from the pending bets."""
+    click.echo(f'exposure recomputed for {risk.recompute()} selections')
+
+
+@bp.cli.command('set-admin')
+@click.argument('username')
+@click.option('--revoke', is_flag=True)
+def set_admin_command(username, revoke):
+    """Grant (or revoke) admin rights for settling bets."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No user {username}')
+    user.is_admin = not revoke
+    db.session.commit()
+
+
+@bp.cli.command('withdrawals-worker')
+@click.option('--processes', default=1, show_default=True, help='Worker processes to fork.')
+@click.option('--batch-size', default=withdrawals.DEFAULT_BATCH_SIZE, show_default=True, help='Jobs claimed at a time.')
+@click.option('--poll-interval', default=2.0, show_default=True, help='Seconds to sleep when the queue is empty.')
+@click.option('--max-attempts', default=5, show_default=True, help='Provider attempts before a withdrawal is refunded.')
+@click.option('--once', is_flag=True, help='Exit once no payouts are due instead of polling.')
+def withdrawals_worker_command(processes, batch_size, poll_interval, max_attempts, once):
+    """Send queued withdrawals to the payout provider."""
+    app = current_app._get_current_object()
+    provider = withdrawals.load_provider(app)
+
+    def work():
+        withdrawals.run_worker(provider, batch_size=batch_size, poll_interval=poll_interval,
+                               max_attempts=max_attempts, once=once, log=click.echo)
+
+    if processes == 1:
+        work()
+        return
+
+    def child():
+        with app.app_context():
+            # Pooled connections inherited from the parent must not be shared
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+            work()
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=child) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+@bp.cli.command('approve-withdrawals')
+@click.argument('job_ids', type=int, nargs=-1)
+@click.option('--all', 'approve_all', is_flag=True, help='Approve every held withdrawal.')
+def approve_withdrawals_command(job_ids, approve_all):
+    """Release held withdrawals to the payout workers."""
+    if not job_ids and not approve_all:
+        raise click.ClickException('Pass the payout job ids to approve, or --all')
+    click.echo(f'{withdrawals.approve(list(job_ids) or None)} withdrawals approved')
+
+
+@bp.cli.command('reconcile')
+@click.option('--processes', default=1, show_default=True, help='Worker processes to fork.')
+@click.option('--range-size', default=reconcile.DEFAULT_RANGE_SIZE, show_default=True, help='User ids per task.')
+@click.option('--chunk-size', default=reconcile.DEFAULT_CHUNK_SIZE, show_default=True, help='Rows fetched at a time.')
+@click.option('--max-details', default=20, show_default=True, help='Drifted users whose offending rows are listed.')
+@click.pass_context
+def reconcile_command(ctx, processes, range_size, chunk_size, max_details):
+    """Check every balance against the ledger and the bet and transaction history.
+
+    Exits with status 1 if any balance drifted.
+    """
+    started = time.perf_counter()
+    checked, drifts = reconcile.run(current_app._get_current_object(), processes, range_size, chunk_size)
+    for number, drift in enumerate(drifts):
+        click.echo(f'user {drift.user_id}: balance {from_cents(drift.balance_cents)}, '
+                   f'ledger {from_cents(drift.ledger_cents)}, history {from_cents(drift.expected_cents)}')
+        if number < max_details:
+            for finding in reconcile.details(drift.user_id):
+                click.echo(f'  {finding.kind} {finding.reference or "(all settlements)"}: '
+                           f'expected {from_cents(finding.expected_cents)}, '
+                           f'ledger {from_cents(finding.found_cents)}')
+    click.echo(f'{checked} users checked, {len(drifts)} drifted, {time.perf_counter() - started:.1f}s')
+    if drifts:
+        ctx.exit(1)
+
+
+@bp.cli.command('archive')
+@click.option('--older-than', 'after_days', type=int, help='Age in days (default: ARCHIVE_AFTER_DAYS, 90).')
+@click.option('--batch-size', default=archive.DEFAULT_BATCH_SIZE, show_default=True, help='Rows moved per transaction.')
+@click.option('--vacuum-full', is_flag=True, help='Rewrite the SQLite file instead of an incremental vacuum.')
+def archive_command(after_days, batch_size, vacuum_full):
+    """Move settled bets and finished transactions into the archive tables."""
+    if after_days is None:
+        after_days = current_app.config.get('ARCHIVE_AFTER_DAYS', archive.DEFAULT_AFTER_DAYS)
+    moved = archive.run(after_days, batch_size,
+                        progress=lambda model, count: click.echo(f'{count} {model.__tablename__} rows archived'))
+    click.echo(', '.join(f'{count} {model.__tablename__} rows' for model, count in moved.items()) + ' archived')
+    freed = archive.vacuum(full=vacuum_full)
+    if freed is not None:
+        click.echo(f'{freed // 1024} KiB returned to the filesystem')
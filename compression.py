@@ -0,0 +1,39 @@
+"""Gzip for dynamic responses.
+
+Rendered pages and JSON are compressed on the way out when the client accepts
+gzip. Streamed responses (the odds stream, exports) and files (already
+precompressed by :mod:`assets`) pass through untouched, as do bodies too small
+to gain anything. A strong ETag becomes weak, since the bytes on the wire now
+depend on the encoding; conditional requests still match it.
+"""
+import gzip
+
+from flask import request
+
+COMPRESSIBLE = {'text/html', 'application/json', 'text/plain', 'text/csv'}
+
+
+def compress(response, level, min_size):
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or response.mimetype not in COMPRESSIBLE):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip'] or (response.content_length or 0) < min_size:
+        return response
+
+    response.set_data(gzip.compress(response.get_data(), compresslevel=level, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    level = app.config.setdefault('COMPRESS_LEVEL', 6)
+    min_size = app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+
+    @app.after_request
+    def compress_response(response):
+        return compress(response, level, min_size)
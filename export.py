@@ -0,0 +1,96 @@
+"""Streaming CSV / JSON Lines export of bets and transactions.
+
+Rows are read with ``yield_per`` so the database cursor is consumed in
+batches, written into a small buffer and handed out chunk by chunk,
+optionally through an incremental gzip compressor. Memory use stays flat
+however long the account history is. Archived rows are merged in order from
+a second cursor.
+"""
+import csv
+import heapq
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import db, Bet, ArchivedBet, Transaction, ArchivedTransaction
+from money import from_cents
+
+BATCH_SIZE = 1000
+
+COLUMNS = {
+    'bets': ((Bet, ArchivedBet),
+             ['id', 'user_id', 'created_at', 'amount_cents', 'prediction', 'selection_id', 'odds', 'result']),
+    'transactions': ((Transaction, ArchivedTransaction),
+                     ['id', 'user_id', 'created_at', 'type', 'amount_cents', 'status']),
+}
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def parse_date(value, end=False):
+    """Parse an ISO date or datetime; a bare end date includes that whole day."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def iter_records(kind, user_id=None, start=None, end=None, batch_size=BATCH_SIZE):
+    models, columns = COLUMNS[kind]
+    streams = []
+    for model in models:
+        query = select(*(getattr(model, column) for column in columns)).order_by(model.created_at, model.id)
+        if user_id is not None:
+            query = query.where(model.user_id == user_id)
+        if start is not None:
+            query = query.where(model.created_at >= start)
+        if end is not None:
+            query = query.where(model.created_at < end)
+        streams.append(db.session.execute(query.execution_options(yield_per=batch_size)))
+    for row in heapq.merge(*streams, key=lambda row: (row.created_at, row.id)):
+        record = row._asdict()
+        record['amount'] = str(from_cents(record.pop('amount_cents')))
+        record['created_at'] = record['created_at'].isoformat(sep=' ', timespec='seconds')
+        yield record
+
+
+def header(kind):
+    return [column if column != 'amount_cents' else 'amount' for column in COLUMNS[kind][1]]
+
+
+def iter_lines(kind, fmt, records, flush_every=BATCH_SIZE):
+    """Encode records as CSV or JSONL, yielding one bytes chunk per ``flush_every`` rows."""
+    buffer = io.StringIO()
+    fields = header(kind)
+    writer = csv.DictWriter(buffer, fieldnames=fields) if fmt == 'csv' else None
+    if writer:
+        writer.writeheader()
+    for count, record in enumerate(records, 1):
+        if writer:
+            writer.writerow(record)
+        else:
+            buffer.write(json.dumps({field: record[field] for field in fields}, separators=(',', ':')) + '\n')
+        if count % flush_every == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(kind, fmt, user_id=None, start=None, end=None, compress=False):
+    chunks = iter_lines(kind, fmt, iter_records(kind, user_id, start, end))
+    return gzipped(chunks) if compress else chunks
@@ -0,0 +1,37 @@
+"""gunicorn settings, read from the working directory by ``gunicorn wsgi:app``.
+
+Workers are gevent by default: each request runs in a greenlet, so a slow
+client, a database wait or an open ``/odds/stream`` costs a few kilobytes
+instead of a worker. ``worker_connections`` caps the clients of one worker;
+the database pool (see :mod:`storage`) caps how many of them query at once.
+
+Everything can be overridden from the environment, e.g.
+``GUNICORN_WORKER_CLASS=sync GUNICORN_WORKERS=4`` for the classic setup, or
+with ``GUNICORN_CMD_ARGS``.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+# One process per core does the CPU work; gevent multiplexes the waiting within each
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 4000))
+backlog = 4096
+keepalive = 5
+timeout = 30
+# Odds streams end on their own after ODDS_STREAM_MAX_AGE; a restart does not wait for them
+graceful_timeout = 10
+
+# The app must be loaded after gevent has patched the worker, or its locks,
+# conditions and the odds poller thread stay blocking
+preload_app = False
+
+
+def on_starting(server):
+    # Outside async workers each open /odds/stream would hold a worker (or thread)
+    # for up to ODDS_STREAM_MAX_AGE; the workers inherit this from the master
+    from gunicorn.workers.base_async import AsyncWorker
+
+    if not issubclass(server.cfg.worker_class, AsyncWorker):
+        os.environ.setdefault('BETTINGKING_ODDS_STREAM_ENABLED', 'false')
@@ -0,0 +1,111 @@
+"""Keyset pagination of a user's bets and transactions.
+
+Pages are keyed on (created_at, id) rather than OFFSET so every page is a
+bounded range scan of the ``(user_id, created_at, id)`` indexes, however long
+the history is. Cursors are opaque url-safe strings.
+
+Bets and transactions moved to the archive tables by :mod:`archive` are merged
+into the pages that reach back to them; pages newer than a user's newest
+archived row never touch the archive.
+"""
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from models import Bet, ArchivedBet, Transaction, ArchivedTransaction
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+RESULTS = {'win': 'Win', 'lose': 'Lose', 'pending': 'Pending'}
+
+
+def encode_cursor(row):
+    raw = f'{row.created_at.isoformat()}|{row.id}'
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def page_args(args):
+    """Normalise the result/order/cursor/limit query string of the history views."""
+    result = args.get('result', 'all').lower()
+    order = 'oldest' if args.get('order') == 'oldest' else 'newest'
+    cursor = args.get('cursor') or None
+    try:
+        limit = min(max(int(args.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        limit = PAGE_SIZE
+    return (result if result in RESULTS else 'all'), order, cursor, limit
+
+
+def ordered(query, model, order, position):
+    if order == 'oldest':
+        if position:
+            created_at, row_id = position
+            query = query.filter(model.created_at >= created_at,
+                                 or_(model.created_at > created_at,
+                                     and_(model.created_at == created_at, model.id > row_id)))
+        return query.order_by(model.created_at.asc(), model.id.asc())
+    if position:
+        created_at, row_id = position
+        query = query.filter(model.created_at <= created_at,
+                             or_(model.created_at < created_at,
+                                 and_(model.created_at == created_at, model.id < row_id)))
+    return query.order_by(model.created_at.desc(), model.id.desc())
+
+
+def row_key(row):
+    return row.created_at, row.id
+
+
+def newest_key(query, model):
+    row = query.with_entities(model.created_at, model.id).order_by(model.created_at.desc(), model.id.desc()).first()
+    return tuple(row) if row else None
+
+
+def keyset_page(query, model, order='newest', cursor=None, limit=PAGE_SIZE, archive=None):
+    """Return one page of ``query`` over ``model`` and the cursor of the next page.
+
+    ``archive`` is an optional ``(query, model)`` pair over the archive table
+    of ``model``, merged in when the page reaches back past its newest row.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    rows = ordered(query, model, order, position).limit(limit + 1).all()
+    if archive:
+        archive_query, archive_model = archive
+        newest = newest_key(archive_query, archive_model)
+        if order == 'oldest':
+            reached = newest is not None and (position is None or position < newest)
+        else:
+            reached = newest is not None and (len(rows) <= limit or row_key(rows[-1]) < newest)
+        if reached:
+            rows += ordered(archive_query, archive_model, order, position).limit(limit + 1).all()
+            rows = sorted(rows, key=row_key, reverse=order != 'oldest')[:limit + 1]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def bet_page(user_id, result='all', order='newest', cursor=None, limit=PAGE_SIZE):
+    def query(model):
+        query = model.query.filter(model.user_id == user_id)
+        if result in RESULTS:
+            query = query.filter(model.result == RESULTS[result])
+        return query
+    # Only settled bets are archived
+    archive = (query(ArchivedBet), ArchivedBet) if result != 'pending' else None
+    return keyset_page(query(Bet), Bet, order, cursor, limit, archive)
+
+
+def transaction_page(user_id, order='newest', cursor=None, limit=PAGE_SIZE):
+    return keyset_page(Transaction.query.filter(Transaction.user_id == user_id), Transaction, order, cursor, limit,
+                       archive=(ArchivedTransaction.query.filter(ArchivedTransaction.user_id == user_id),
+                                ArchivedTransaction))
+
@@ -0,0 +1,132 @@
+"""Idempotency keys for the POSTs that move money.
+
+Clients send an ``Idempotency-Key`` header (the HTML forms send a hidden
+``idempotency_key`` field generated when the form is rendered). The first
+request with a key inserts an ``IdempotencyKey`` row in the same transaction as
+its own writes, so a concurrent duplicate is stopped by the unique
+``(user_id, key)`` constraint rather than by a racy pre-read, and a request
+that rolls back leaves no key behind. Its response is stored once the view
+returns and replayed to every retry within ``IDEMPOTENCY_KEY_TTL`` seconds.
+
+A retry that arrives while the first request is still running gets a 409 with
+``Retry-After``; reusing a key for a different request gets a 422.
+"""
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import request, current_app, jsonify
+from flask_login import current_user
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+
+from models import db, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+PURGE_BATCH_SIZE = 10000
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def fingerprint():
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    if request.form:
+        digest.update(json.dumps(sorted(
+            (name, value) for name, value in request.form.items(multi=True) if name != FORM_FIELD
+        )).encode())
+    else:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def replay(record, request_fingerprint):
+    if record.fingerprint != request_fingerprint:
+        return jsonify(error=f'{HEADER} was already used for a different request'), 422
+    if record.status_code is None:
+        return jsonify(error='A request with this key is still in progress'), 409, {'Retry-After': '1'}
+    response = current_app.response_class(record.body, status=record.status_code, headers=record.headers)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Replay the stored response to retried POSTs that carry the same key. Use inside login_required."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        key = request.headers.get(HEADER) or request.form.get(FORM_FIELD)
+        if request.method != 'POST' or not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify(error=f'{HEADER} is longer than {MAX_KEY_LENGTH} characters'), 400
+
+        user_id = current_user.id
+        request_fingerprint = fingerprint()
+        record = IdempotencyKey(user_id=user_id, key=key, fingerprint=request_fingerprint)
+        db.session.add(record)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            existing = db.session.scalar(
+                select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            )
+            if existing is None or existing.created_at < expiry():
+                # Purged or expired meanwhile: the key is free again
+                db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id,
+                                                                IdempotencyKey.key == key,
+                                                                IdempotencyKey.created_at < expiry()))
+                db.session.commit()
+                return wrapped(*args, **kwargs)
+            return replay(existing, request_fingerprint)
+
+        record_id = record.id
+        response = current_app.make_response(view(*args, **kwargs))
+        values = {
+            'status_code': response.status_code,
+            'headers': {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers},
+            'body': response.get_data(),
+        }
+        stored = db.session.execute(
+            update(IdempotencyKey).where(IdempotencyKey.id == record_id).values(**values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not stored:
+            # The view rolled back, taking the key with it: remember its answer anyway
+            db.session.add(IdempotencyKey(user_id=user_id, key=key, fingerprint=request_fingerprint, **values))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # a retry claimed the key in the meantime
+        return response
+    return wrapped
+
+
+def expiry():
+    return datetime.utcnow() - timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL'])
+
+
+def purge(batch_size=PURGE_BATCH_SIZE):
+    """Delete expired keys, one committed batch at a time. Returns how many were deleted."""
+    cutoff = expiry()
+    deleted = 0
+    while True:
+        ids = select(IdempotencyKey.id).where(IdempotencyKey.created_at < cutoff).limit(batch_size)
+        count = db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def init_app(app):
+    app.config.setdefault('IDEMPOTENCY_KEY_TTL', 24 * 3600)
+    app.jinja_env.globals['idempotency_key'] = new_key
@@ -0,0 +1,114 @@
+"""Cached user loader for Flask-Login.
+
+Only immutable identity data (id, username) is cached, in a bounded TTL/LRU
+map, so authenticated requests skip the per-request ``User`` query. The
+balance and the admin flag are never cached: :class:`CachedUser` reads them
+from the database the first time a request asks for either, together with the
+user's data version, so a revoked admin loses access on the next request in
+every worker.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+from flask_login import LoginManager, UserMixin
+from sqlalchemy import select
+from werkzeug.local import LocalProxy
+
+from models import db, User
+from money import from_cents
+
+Identity = namedtuple('Identity', 'id username')
+
+
+class IdentityCache:
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        row = db.session.execute(
+            select(User.id, User.username).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        identity = Identity(*row)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, identity)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class CachedUser(UserMixin):
+    """Per-request user object built from a cached :class:`Identity`."""
+
+    def __init__(self, identity):
+        self.id = identity.id
+        self.username = identity.username
+        self._account = None
+
+    def account(self):
+        if self._account is None:
+            self._account = db.session.execute(
+                select(User.balance_cents, User.data_version, User.is_admin).where(User.id == self.id)
+            ).one()
+        return self._account
+
+    @property
+    def balance_cents(self):
+        return self.account().balance_cents
+
+    @property
+    def data_version(self):
+        return self.account().data_version
+
+    @property
+    def is_admin(self):
+        return self.account().is_admin
+
+    @property
+    def balance(self):
+        return from_cents(self.balance_cents)
+
+
+cache = LocalProxy(lambda: current_app.extensions['identity.cache'])
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    identity = cache.get(int(user_id))
+    return CachedUser(identity) if identity else None
+
+
+def init_app(app):
+    app.extensions['identity.cache'] = IdentityCache(app.config.setdefault('USER_CACHE_SIZE', 10000),
+                                                     app.config.setdefault('USER_CACHE_TTL', 300))
+    login_manager.init_app(app)
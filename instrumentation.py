@@ -0,0 +1,204 @@
+"""Per-request timing, SQL counting, opt-in profiling and Prometheus metrics.
+
+Every request records its wall time and the number and duration of the SQL
+statements it ran, which are exposed as histograms on ``/metrics`` and per
+response in a ``Server-Timing`` header. Requests that run more than
+``SQL_QUERY_WARN_THRESHOLD`` statements are logged to help catch N+1 queries.
+
+cProfile can be turned on for a random ``PROFILE_SAMPLE_RATE`` share of
+requests, or for one request by sending ``X-Profile: <PROFILING_TOKEN>``.
+Profiles go to the log, and to ``PROFILE_DIR`` when set.
+
+``/metrics`` requires ``Authorization: Bearer <METRICS_TOKEN>`` and is
+refused while no token is configured. Metrics are kept per process; with
+several gunicorn workers each one reports its own counts.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request, has_request_context, abort
+from sqlalchemy import event
+
+import identity
+import templating
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in sorted(items):
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return '\n'.join(lines)
+
+
+request_duration = Histogram('bettingking_request_duration_seconds', 'Wall time per request.',
+                             ('endpoint', 'method'))
+request_total = Counter('bettingking_requests_total', 'Requests by response status.',
+                        ('endpoint', 'method', 'status'))
+sql_queries = Histogram('bettingking_sql_queries_per_request', 'SQL statements run per request.',
+                        ('endpoint',), QUERY_BUCKETS)
+sql_duration = Histogram('bettingking_sql_duration_seconds', 'Time spent in SQL per request.', ('endpoint',))
+METRICS = [request_duration, request_total, sql_queries, sql_duration]
+
+
+def render_metrics():
+    lines = [metric.render() for metric in METRICS]
+    stats = identity.cache.stats()
+    lines += [
+        '# HELP bettingking_user_cache_lookups_total Identity cache lookups by outcome.',
+        '# TYPE bettingking_user_cache_lookups_total counter',
+        f'bettingking_user_cache_lookups_total{{outcome="hit"}} {stats["hits"]}',
+        f'bettingking_user_cache_lookups_total{{outcome="miss"}} {stats["misses"]}',
+        '# HELP bettingking_user_cache_size Identities currently cached.',
+        '# TYPE bettingking_user_cache_size gauge',
+        f'bettingking_user_cache_size {stats["size"]}',
+    ]
+    pages = templating.user_pages.stats()
+    lines += [
+        '# HELP bettingking_user_page_cache_lookups_total Rendered user page lookups by outcome.',
+        '# TYPE bettingking_user_page_cache_lookups_total counter',
+        f'bettingking_user_page_cache_lookups_total{{outcome="hit"}} {pages["hits"]}',
+        f'bettingking_user_page_cache_lookups_total{{outcome="miss"}} {pages["misses"]}',
+        '# HELP bettingking_user_page_cache_bytes Bytes of rendered user pages held.',
+        '# TYPE bettingking_user_page_cache_bytes gauge',
+        f'bettingking_user_page_cache_bytes {pages["bytes"]}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    took = time.perf_counter() - conn.info['query_started'].pop()
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_time += took
+
+
+def init_app(app, db):
+    app.config.setdefault('SQL_QUERY_WARN_THRESHOLD', 50)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILING_TOKEN', None)
+    app.config.setdefault('PROFILE_DIR', None)
+    app.config.setdefault('METRICS_TOKEN', None)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def wants_profile():
+        token = app.config['PROFILING_TOKEN']
+        if token and hmac.compare_digest(request.headers.get('X-Profile', ''), token):
+            return True
+        return random.random() < app.config['PROFILE_SAMPLE_RATE']
+
+    @app.before_request
+    def start_timing():
+        g.request_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_time = 0.0
+        if wants_profile():
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_timing(response):
+        if 'request_started' not in g:
+            return response
+        took = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unmatched'
+        request_duration.observe(took, endpoint, request.method)
+        request_total.inc(endpoint, request.method, response.status_code)
+        sql_queries.observe(g.sql_queries, endpoint)
+        sql_duration.observe(g.sql_time, endpoint)
+        response.headers['Server-Timing'] = (
+            f'app;dur={took * 1000:.1f}, db;dur={g.sql_time * 1000:.1f};desc="{g.sql_queries} queries"'
+        )
+        if g.sql_queries > app.config['SQL_QUERY_WARN_THRESHOLD']:
+            app.logger.warning('%s %s ran %d SQL statements (%.1f ms)', request.method, request.path,
+                               g.sql_queries, g.sql_time * 1000)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(25)
+            app.logger.info('Profile of %s %s:\n%s', request.method, request.path, report.getvalue())
+            if app.config['PROFILE_DIR']:
+                # Logged rather than sent back: the client has no business knowing server paths
+                path = os.path.join(app.config['PROFILE_DIR'], f'{endpoint}-{time.time():.6f}.prof')
+                profiler.dump_stats(path)
+                app.logger.info('Profile of %s %s saved to %s', request.method, request.path, path)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        if not token:
+            abort(403)
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+        return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
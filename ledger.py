@@ -0,0 +1,103 @@
+"""Balance ledger.
+
+All balance changes go through :func:`debit` and :func:`credit`. Each one is a
+single conditional ``UPDATE`` on the user row, so concurrent workers never
+read-modify-write a stale balance, followed by a double-entry posting in the
+same transaction. Neither function commits; the caller commits once together
+with the ``Bet``/``Transaction`` row the movement belongs to.
+
+The same UPDATEs bump ``User.data_version``, which versions everything a user
+sees about their account; changes that move no money (a lost bet, a completed
+withdrawal) bump it with :func:`touch`.
+"""
+from uuid import uuid4
+
+from sqlalchemy import update, insert, bindparam
+
+from models import db, User, LedgerEntry
+
+HOUSE_CASH = 'house:cash'  # money entering or leaving the platform
+HOUSE_BETS = 'house:bets'  # stakes held and payouts made by the book
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def user_account(user_id):
+    return f'user:{user_id}'
+
+
+def debit(user_id, amount_cents, kind, reference=None, counter_account=HOUSE_CASH):
+    """Take ``amount_cents`` from the user, raising InsufficientFunds if the balance is short."""
+    if amount_cents <= 0:
+        raise ValueError('Debit amount must be positive')
+    result = db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.balance_cents >= amount_cents)
+        .values(balance_cents=User.balance_cents - amount_cents, data_version=User.data_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise InsufficientFunds()
+    post(user_id, -amount_cents, kind, reference, counter_account)
+
+
+def credit(user_id, amount_cents, kind, reference=None, counter_account=HOUSE_CASH):
+    if amount_cents <= 0:
+        raise ValueError('Credit amount must be positive')
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(balance_cents=User.balance_cents + amount_cents, data_version=User.data_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    post(user_id, amount_cents, kind, reference, counter_account)
+
+
+def credit_many(credits, kind, reference=None, counter_account=HOUSE_CASH):
+    """Credit several users at once from a ``{user_id: amount_cents}`` mapping.
+
+    Issues one executemany UPDATE and one bulk INSERT of ledger legs, however
+    many users are credited.
+    """
+    credits = {user_id: cents for user_id, cents in credits.items() if cents > 0}
+    if not credits:
+        return
+    users = User.__table__
+    db.session.execute(
+        update(users)
+        .where(users.c.id == bindparam('uid'))
+        .values(balance_cents=users.c.balance_cents + bindparam('cents'), data_version=users.c.data_version + 1),
+        [{'uid': user_id, 'cents': cents} for user_id, cents in credits.items()],
+    )
+    rows = []
+    for user_id, cents in credits.items():
+        group = uuid4().hex
+        rows.append(dict(entry_group=group, account=user_account(user_id), user_id=user_id,
+                         amount_cents=cents, kind=kind, reference=reference))
+        rows.append(dict(entry_group=group, account=counter_account, user_id=user_id,
+                         amount_cents=-cents, kind=kind, reference=reference))
+    db.session.execute(insert(LedgerEntry), rows)
+
+
+def touch(user_ids=None):
+    """Bump the data version of ``user_ids`` (every user if None) after a change that moved no money."""
+    statement = update(User).values(data_version=User.data_version + 1)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        statement = statement.where(User.id.in_(user_ids))
+    db.session.execute(statement.execution_options(synchronize_session=False))
+
+
+def post(user_id, amount_cents, kind, reference, counter_account):
+    """Append both legs of a posting; ``amount_cents`` is signed from the user's side."""
+    group = uuid4().hex
+    db.session.add_all([
+        LedgerEntry(entry_group=group, account=user_account(user_id), user_id=user_id,
+                    amount_cents=amount_cents, kind=kind, reference=reference),
+        LedgerEntry(entry_group=group, account=counter_account, user_id=user_id,
+                    amount_cents=-amount_cents, kind=kind, reference=reference),
+    ])
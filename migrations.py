@@ -0,0 +1,198 @@
+"""Upgrading databases created by earlier versions of the app.
+
+``flask init-db`` runs :func:`upgrade`, which brings a database of any age up
+to the current models. Every step looks at the live schema first, so running
+it again, or on a new database, changes nothing:
+
+* the float ``user.balance``, ``bet.amount`` and ``transaction.amount`` of the
+  original app become integer ``*_cents`` columns, and the history is posted to
+  the ledger (see :func:`post_opening_ledger`) so reconciliation balances;
+* columns added to existing tables since (``user.is_admin``,
+  ``user.data_version``, the odds columns of ``bet``, the ``settlement_run``
+  market and slip cursor, the ``selection`` exposure counters) are added with
+  their defaults;
+* missing tables and indexes are created, and string columns that were widened
+  (``user.password``) are altered where the database enforces lengths;
+* totals kept incrementally are computed for the rows that predate them:
+  :func:`user_stats.rebuild` when ``user_stats`` is new, :func:`risk.recompute`
+  when the exposure counters are.
+"""
+from collections import defaultdict
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import inspect, insert, literal, select, text
+
+from models import db, User, Bet, Transaction, LedgerEntry
+from settlement import payout_cents
+import ledger
+import risk
+import user_stats
+
+# table: (float column of the original app, integer cents column replacing it)
+FLOAT_MONEY = {'user': ('balance', 'balance_cents'), 'bet': ('amount', 'amount_cents'),
+               'transaction': ('amount', 'amount_cents')}
+BATCH_SIZE = 5000
+
+
+def columns(connection, table):
+    return {column['name']: column for column in inspect(connection).get_columns(table)}
+
+
+def money_to_cents(connection):
+    """Replace the float money columns with cents; returns the tables converted."""
+    quote = connection.dialect.identifier_preparer.quote
+    converted = []
+    for table, (old, new) in FLOAT_MONEY.items():
+        if not inspect(connection).has_table(table):
+            continue
+        existing = columns(connection, table)
+        if old not in existing or new in existing:
+            continue
+        connection.execute(text(f'ALTER TABLE {quote(table)} ADD COLUMN {new} BIGINT NOT NULL DEFAULT 0'))
+        connection.execute(text(f'UPDATE {quote(table)} SET {new} = CAST(ROUND(COALESCE({old}, 0) * 100) AS BIGINT)'))
+        # Needs SQLite 3.35; the old column is NOT NULL, so new rows could not be inserted with it left in
+        connection.execute(text(f'ALTER TABLE {quote(table)} DROP COLUMN {old}'))
+        converted.append(table)
+    return converted
+
+
+def add_columns(connection):
+    """Add the model columns missing from existing tables; returns ``[(table, column)]``."""
+    dialect = connection.dialect
+    quote = dialect.identifier_preparer.quote
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspect(connection).has_table(table.name):
+            continue
+        existing = columns(connection, table.name)
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect)}'
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                value = literal(default, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+                ddl += f' DEFAULT {value}'
+            if not column.nullable:
+                if default is None:
+                    raise RuntimeError(f'{table.name}.{column.name} is NOT NULL without a default to fill it')
+                ddl += ' NOT NULL'
+            connection.execute(text(ddl))
+            added.append((table.name, column.name))
+    return added
+
+
+def widen_strings(connection):
+    """ALTER string columns shorter than the model; SQLite does not enforce lengths, so it is skipped."""
+    if connection.dialect.name == 'sqlite':
+        return []
+    quote = connection.dialect.identifier_preparer.quote
+    widened = []
+    for table in db.metadata.sorted_tables:
+        if not inspect(connection).has_table(table.name):
+            continue
+        existing = columns(connection, table.name)
+        for column in table.columns:
+            length = getattr(column.type, 'length', None)
+            current = getattr(existing[column.name]['type'], 'length', None)
+            if length and current and current < length:
+                connection.execute(text(f'ALTER TABLE {quote(table.name)} ALTER COLUMN {quote(column.name)} '
+                                        f'TYPE {column.type.compile(connection.dialect)}'))
+                widened.append((table.name, column.name))
+    return widened
+
+
+def create_indexes():
+    """Create indexes declared on tables that already existed (``create_all`` skips those)."""
+    created = []
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+    return created
+
+
+def post_opening_ledger():
+    """Post the history of balances that predate the ledger; returns the users posted.
+
+    Each deposit, withdrawal, stake and payout becomes the posting the ledger
+    would have written for it, by the rules :mod:`reconcile` checks (a winning
+    bet without a price paid twice its stake). Whatever the history does not
+    explain of a user's balance is posted as ``opening``, so the ledger agrees
+    with every balance and ``flask reconcile`` lists the users whose history
+    does not add up.
+    """
+    postings = defaultdict(list)  # user_id: [(amount_cents, kind, reference, counter_account, created_at)]
+    for row in db.session.execute(select(Transaction.id, Transaction.user_id, Transaction.type,
+                                         Transaction.amount_cents, Transaction.status, Transaction.created_at)):
+        reference = f'transaction:{row.id}'
+        if row.type == 'deposit':
+            postings[row.user_id].append((row.amount_cents, 'deposit', reference, ledger.HOUSE_CASH, row.created_at))
+            continue
+        postings[row.user_id].append((-row.amount_cents, 'withdrawal', reference, ledger.HOUSE_CASH, row.created_at))
+        if row.status == 'Failed':
+            postings[row.user_id].append((row.amount_cents, 'refund', reference, ledger.HOUSE_CASH, row.created_at))
+    for row in db.session.execute(select(Bet.id, Bet.user_id, Bet.amount_cents, Bet.odds, Bet.result, Bet.created_at)):
+        reference = f'bet:{row.id}'
+        postings[row.user_id].append((-row.amount_cents, 'stake', reference, ledger.HOUSE_BETS, row.created_at))
+        if row.result in ('Win', 'Void'):
+            postings[row.user_id].append((payout_cents(row.amount_cents, row.result, row.odds), 'payout', reference,
+                                          ledger.HOUSE_BETS, row.created_at))
+
+    rows = []
+    now = datetime.utcnow()
+    users = db.session.execute(select(User.id, User.balance_cents)).all()
+    for user_id, balance_cents in users:
+        user_postings = postings.get(user_id, [])
+        unexplained = balance_cents - sum(posting[0] for posting in user_postings)
+        if unexplained:
+            user_postings.append((unexplained, 'opening', 'migration', ledger.HOUSE_CASH, now))
+        for amount_cents, kind, reference, counter_account, created_at in user_postings:
+            if not amount_cents:
+                continue
+            created_at = created_at or now
+            group = uuid4().hex
+            rows.append(dict(entry_group=group, account=ledger.user_account(user_id), user_id=user_id,
+                             amount_cents=amount_cents, kind=kind, reference=reference, created_at=created_at))
+            rows.append(dict(entry_group=group, account=counter_account, user_id=user_id,
+                             amount_cents=-amount_cents, kind=kind, reference=reference, created_at=created_at))
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(LedgerEntry), rows[start:start + BATCH_SIZE])
+    db.session.commit()
+    return len(users)
+
+
+def upgrade(progress=None):
+    """Bring the database up to the current models; ``progress(message)`` hears about each change."""
+    def report(message):
+        if progress:
+            progress(message)
+
+    before = set(inspect(db.engine).get_table_names())
+    with db.engine.begin() as connection:
+        converted = money_to_cents(connection)
+        added = add_columns(connection)
+        widened = widen_strings(connection)
+    for table in converted:
+        report(f'{table}: float amounts converted to cents')
+    for table, column in added:
+        report(f'{table}.{column} added')
+    for table, column in widened:
+        report(f'{table}.{column} widened')
+
+    db.create_all()
+    for table in sorted(set(inspect(db.engine).get_table_names()) - before):
+        report(f'{table} created')
+    for name in create_indexes():
+        report(f'index {name} created')
+
+    if 'user' in converted and 'ledger_entry' not in before:
+        report(f'opening ledger posted for {post_opening_ledger()} users')
+    if 'user_stats' not in before and 'user' in before:
+        user_stats.rebuild()
+        report('user stats rebuilt')
+    if ('selection', 'liability_cents') in added:
+        report(f'exposure recomputed for {risk.recompute()} selections')
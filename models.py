@@ -0,0 +1,312 @@
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+from datetime import datetime
+
+from money import from_cents
+from storage import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# A column added to a table that has already shipped needs a scalar default or
+# nullable=True: ``flask init-db`` adds it to existing databases with ALTER
+# TABLE (see migrations.py), as it did for User.is_admin and data_version,
+# Bet.selection_id/odds/odds_version, SettlementRun.market_id/last_slip_id and
+# the Selection exposure counters.
+
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password = db.Column(db.String(255), nullable=False)
+    balance_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    is_admin = db.Column(db.Boolean, nullable=False, default=False)
+    # Bumped by every change to the user's balance, bets or transactions; see ledger.touch
+    data_version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @property
+    def balance(self):
+        return from_cents(self.balance_cents)
+
+
+class BetColumns:
+    """Columns shared by ``Bet`` and its archive, ``ArchivedBet``."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+    prediction = db.Column(db.String(120), nullable=False)
+    result = db.Column(db.String(20), default='Pending')
+    selection_id = db.Column(db.Integer, db.ForeignKey('selection.id'))
+    odds = db.Column(db.Float)  # price the bet was accepted at
+    odds_version = db.Column(db.Integer)  # Selection.odds_version at acceptance
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def amount(self):
+        return from_cents(self.amount_cents)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'amount': str(self.amount),
+            'prediction': self.prediction,
+            'selection_id': self.selection_id,
+            'odds': self.odds,
+            'result': self.result,
+            'created_at': self.created_at.isoformat(sep=' ', timespec='seconds'),
+        }
+
+
+class Bet(BetColumns, db.Model):
+    __table_args__ = (
+        # Serves the keyset-paged history query: WHERE user_id = ? ORDER BY created_at, id
+        db.Index('ix_bet_user_created_id', 'user_id', 'created_at', 'id'),
+        # Serve settlement: WHERE prediction/selection_id IN (...) AND result = 'Pending'
+        db.Index('ix_bet_prediction_result', 'prediction', 'result'),
+        db.Index('ix_bet_selection_result', 'selection_id', 'result'),
+    )
+
+
+class ArchivedBet(BetColumns, db.Model):
+    """Settled bet moved out of ``bet`` by :mod:`archive`, keeping its id."""
+    __tablename__ = 'bet_archive'
+    __table_args__ = (db.Index('ix_bet_archive_user_created_id', 'user_id', 'created_at', 'id'),)
+
+
+class TransactionColumns:
+    """Columns shared by ``Transaction`` and its archive, ``ArchivedTransaction``."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+    type = db.Column(db.String(20), nullable=False)  # 'deposit' or 'withdrawal'
+    status = db.Column(db.String(20), default='Pending')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def amount(self):
+        return from_cents(self.amount_cents)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'amount': str(self.amount),
+            'status': self.status,
+            'created_at': self.created_at.isoformat(sep=' ', timespec='seconds'),
+        }
+
+
+class Transaction(TransactionColumns, db.Model):
+    __table_args__ = (db.Index('ix_transaction_user_created_id', 'user_id', 'created_at', 'id'),)
+
+
+class ArchivedTransaction(TransactionColumns, db.Model):
+    """Completed or failed transaction moved out of ``transaction`` by :mod:`archive`, keeping its id."""
+    __tablename__ = 'transaction_archive'
+    __table_args__ = (db.Index('ix_transaction_archive_user_created_id', 'user_id', 'created_at', 'id'),)
+
+    payout_reference = db.Column(db.String(80))  # PayoutJob.provider_reference of a withdrawal
+
+
+class LedgerEntry(db.Model):
+    """One leg of a double-entry posting.
+
+    Every balance change writes two rows sharing an ``entry_group``: one on the
+    user's account and an equal and opposite one on a house account, so the
+    amounts of any group always sum to zero.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    entry_group = db.Column(db.String(32), nullable=False, index=True)
+    account = db.Column(db.String(40), nullable=False)  # 'user:<id>' or 'house:<name>'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    amount_cents = db.Column(db.BigInteger, nullable=False)  # positive credits the account
+    kind = db.Column(db.String(20), nullable=False)  # 'deposit', 'withdrawal', 'stake', 'payout'
+    reference = db.Column(db.String(40))  # e.g. 'bet:12' or 'transaction:7'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Event(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)  # e.g. 'Soccer: Team A vs Team B'
+    sport = db.Column(db.String(40))
+    starts_at = db.Column(db.DateTime)
+    featured = db.Column(db.Boolean, nullable=False, default=False)
+    status = db.Column(db.String(20), nullable=False, default='Open')  # 'Open', 'Closed' or 'Settled'
+    markets = db.relationship('Market', backref='event', lazy=True)
+
+
+class Market(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False, index=True)
+    name = db.Column(db.String(80), nullable=False, default='Match Winner')
+    status = db.Column(db.String(20), nullable=False, default='Open')
+    selections = db.relationship('Selection', backref='market', lazy=True)
+
+
+class Selection(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    market_id = db.Column(db.Integer, db.ForeignKey('market.id'), nullable=False, index=True)
+    name = db.Column(db.String(80), nullable=False)
+    odds = db.Column(db.Float, nullable=False)  # decimal odds, e.g. 1.5
+    odds_version = db.Column(db.Integer, nullable=False, default=1)  # bumped on every price change
+    status = db.Column(db.String(20), nullable=False, default='Open')
+    # Running totals of the pending bets on this selection (see risk.py)
+    stake_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    liability_cents = db.Column(db.BigInteger, nullable=False, default=0)  # paid out if it wins
+    liability_limit_cents = db.Column(db.BigInteger)  # None: no limit
+
+
+class OddsState(db.Model):
+    """Single row holding the global odds generation.
+
+    Bumped together with any Selection.odds_version so odds caches can tell
+    whether anything changed with one primary-key read.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SettlementRun(db.Model):
+    """Progress of one bulk settlement, so an interrupted run can be resumed."""
+    id = db.Column(db.Integer, primary_key=True)
+    market_id = db.Column(db.Integer, db.ForeignKey('market.id'))  # set when settling by selection
+    outcomes = db.Column(db.JSON, nullable=False)  # {prediction or selection id: 'Win' | 'Lose' | 'Void'}
+    status = db.Column(db.String(20), nullable=False, default='Running')
+    last_bet_id = db.Column(db.Integer, nullable=False, default=0)
+    last_slip_id = db.Column(db.Integer, nullable=False, default=0)  # bet slips are settled after the bets
+    settled_count = db.Column(db.Integer, nullable=False, default=0)
+    credited_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'market_id': self.market_id,
+            'outcomes': self.outcomes,
+            'status': self.status,
+            'last_bet_id': self.last_bet_id,
+            'last_slip_id': self.last_slip_id,
+            'settled_count': self.settled_count,
+            'credited': str(from_cents(self.credited_cents)),
+        }
+
+
+class UserStats(db.Model):
+    """Running per-user totals, kept up to date in the same transaction as the bet or transaction."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    bets_placed = db.Column(db.Integer, nullable=False, default=0)
+    bets_won = db.Column(db.Integer, nullable=False, default=0)
+    bets_lost = db.Column(db.Integer, nullable=False, default=0)
+    bets_void = db.Column(db.Integer, nullable=False, default=0)
+    total_staked_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    total_won_cents = db.Column(db.BigInteger, nullable=False, default=0)  # payouts on winning bets
+    total_refunded_cents = db.Column(db.BigInteger, nullable=False, default=0)  # stakes returned on void bets
+    open_exposure_cents = db.Column(db.BigInteger, nullable=False, default=0)  # stakes of pending bets
+    total_deposited_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    total_withdrawn_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @property
+    def win_rate(self):
+        settled = self.bets_won + self.bets_lost
+        return self.bets_won / settled if settled else None
+
+    def amount(self, field):
+        return from_cents(getattr(self, f'{field}_cents'))
+
+
+class PayoutJob(db.Model):
+    """Queue entry paying out one withdrawal ``Transaction`` in the background."""
+    __table_args__ = (db.Index('ix_payout_job_status_next_attempt', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=False, unique=True)
+    status = db.Column(db.String(20), nullable=False, default='Queued')  # 'Held', 'Queued', 'Processing', 'Done', 'Failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(64))  # claim token of the worker batch holding the job
+    claimed_at = db.Column(db.DateTime)
+    provider_reference = db.Column(db.String(80))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    transaction = db.relationship('Transaction')
+
+
+class IdempotencyKey(db.Model):
+    """First response to a POST sent with an ``Idempotency-Key``, replayed to retries of it."""
+    __table_args__ = (db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of the method, path and body
+    status_code = db.Column(db.Integer)  # None while the first request is still running
+    headers = db.Column(db.JSON)
+    body = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class ApiToken(db.Model):
+    """Bearer token of the JSON API. Only a SHA-256 of the token is stored."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), nullable=False, unique=True)
+    name = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    revoked_at = db.Column(db.DateTime)
+
+
+class BetSlip(db.Model):
+    """Multi-selection bet: singles, an accumulator or a system bet such as a Yankee.
+
+    ``stake_cents`` is staked on each of the ``combinations`` the system expands
+    to, so the slip costs ``total_stake_cents``.
+    """
+    __table_args__ = (db.Index('ix_bet_slip_user_created_id', 'user_id', 'created_at', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    system = db.Column(db.String(20), nullable=False)  # 'singles', 'accumulator', 'yankee', '2/3', ...
+    combinations = db.Column(db.Integer, nullable=False)
+    stake_cents = db.Column(db.BigInteger, nullable=False)
+    total_stake_cents = db.Column(db.BigInteger, nullable=False)
+    potential_return_cents = db.Column(db.BigInteger, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='Open')  # 'Open' or 'Settled'
+    returned_cents = db.Column(db.BigInteger)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    settled_at = db.Column(db.DateTime)
+    legs = db.relationship('SlipLeg', order_by='SlipLeg.id', lazy='selectin')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'system': self.system,
+            'combinations': self.combinations,
+            'stake': str(from_cents(self.stake_cents)),
+            'total_stake': str(from_cents(self.total_stake_cents)),
+            'potential_return': str(from_cents(self.potential_return_cents)),
+            'status': self.status,
+            'returned': str(from_cents(self.returned_cents)) if self.returned_cents is not None else None,
+            'legs': [leg.to_dict() for leg in self.legs],
+            'created_at': self.created_at.isoformat(sep=' ', timespec='seconds'),
+        }
+
+
+class SlipLeg(db.Model):
+    # Serves settlement: WHERE selection_id IN (...) AND result = 'Pending'
+    __table_args__ = (db.Index('ix_slip_leg_selection_result', 'selection_id', 'result'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    slip_id = db.Column(db.Integer, db.ForeignKey('bet_slip.id'), nullable=False, index=True)
+    selection_id = db.Column(db.Integer, db.ForeignKey('selection.id'), nullable=False)
+    label = db.Column(db.String(120), nullable=False)
+    odds = db.Column(db.Float, nullable=False)  # price the leg was accepted at
+    odds_version = db.Column(db.Integer, nullable=False)
+    result = db.Column(db.String(20), nullable=False, default='Pending')
+
+    def to_dict(self):
+        return {
+            'selection_id': self.selection_id,
+            'label': self.label,
+            'odds': self.odds,
+            'result': self.result,
+        }
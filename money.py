@@ -0,0 +1,26 @@
+from decimal import Decimal, InvalidOperation
+
+# Amounts are stored as integer minor units (cents) so balance arithmetic can
+# happen inside SQL without float rounding drift.
+CENTS = Decimal('0.01')
+# Far above any real stake or payment, and far below the 64-bit column limit
+# (9.2e16 in units) so that sums of many such amounts still fit
+MAX_AMOUNT = Decimal('1000000000')
+# Odds multiply a stake without bound (eight legs at 50.0 turn $10,000 into
+# 3.9e17), so a slip's potential return is capped separately
+MAX_RETURN = Decimal('10000000000')
+
+
+def to_cents(value):
+    """Parse a user supplied amount ("12.5", 12.5, Decimal) into positive integer cents."""
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, AttributeError):
+        raise ValueError(f'Invalid amount: {value!r}')
+    if not amount.is_finite() or not 0 < amount <= MAX_AMOUNT or amount != amount.quantize(CENTS):
+        raise ValueError(f'Invalid amount: {value!r}')
+    return int(amount * 100)
+
+
+def from_cents(cents):
+    return (Decimal(cents or 0) / 100).quantize(CENTS)
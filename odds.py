@@ -0,0 +1,175 @@
+"""Events, markets and prices, plus an odds cache per app and process.
+
+Every price change bumps both ``Selection.odds_version`` and the single
+``OddsState.version`` row, then sends :data:`changed`. :class:`OddsCache` keeps one immutable snapshot of
+all open selections and only reloads it when ``OddsState.version`` moves, so
+serving prices costs at most one primary-key read per check instead of a
+query per selection.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from blinker import signal
+from flask import current_app
+from sqlalchemy import select, update
+from werkzeug.local import LocalProxy
+
+from models import db, Event, Market, Selection, OddsState
+
+ODDS_STATE_ID = 1
+
+SelectionOdds = namedtuple('SelectionOdds', 'id market_id event_id name odds odds_version label')
+MarketOdds = namedtuple('MarketOdds', 'id name selections')
+EventOdds = namedtuple('EventOdds', 'id name sport starts_at featured markets')
+
+
+class OddsChanged(Exception):
+    pass
+
+
+class OddsSnapshot:
+    def __init__(self, version, events):
+        self.version = version
+        self.events = events
+        self.selections = {
+            selection.id: selection
+            for event in events for market in event.markets for selection in market.selections
+        }
+
+    def get(self, selection_id):
+        return self.selections.get(selection_id)
+
+    @property
+    def featured(self):
+        return [event for event in self.events if event.featured]
+
+
+def current_version():
+    return db.session.scalar(select(OddsState.version).where(OddsState.id == ODDS_STATE_ID)) or 0
+
+
+def load_snapshot():
+    rows = db.session.execute(
+        select(Event, Market, Selection)
+        .join(Market, Market.event_id == Event.id)
+        .join(Selection, Selection.market_id == Market.id)
+        .where(Event.status == 'Open', Market.status == 'Open', Selection.status == 'Open')
+        .order_by(Event.starts_at, Event.id, Market.id, Selection.id)
+    ).all()
+    events, markets = {}, {}
+    for event, market, selection in rows:
+        events.setdefault(event.id, (event, []))
+        if market.id not in markets:
+            markets[market.id] = (market, [])
+            events[event.id][1].append(market.id)
+        markets[market.id][1].append(SelectionOdds(
+            selection.id, market.id, event.id, selection.name, selection.odds,
+            selection.odds_version, f'{event.name} - {selection.name}',
+        ))
+    return [
+        EventOdds(event.id, event.name, event.sport, event.starts_at, event.featured, tuple(
+            MarketOdds(market_id, markets[market_id][0].name, tuple(markets[market_id][1]))
+            for market_id in market_ids
+        ))
+        for event, market_ids in events.values()
+    ]
+
+
+class OddsCache:
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self, max_age=None):
+        """Return the current snapshot, checking the DB version at most every ``max_age`` seconds.
+
+        ``max_age=0`` forces a version check, which is what bet placement uses
+        so a bet is never accepted at a price that has already moved.
+        """
+        max_age = self.check_interval if max_age is None else max_age
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < max_age:
+            return snapshot
+        version = current_version()
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = OddsSnapshot(version, load_snapshot())
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self):
+        self._checked_at = 0.0
+
+
+# The current app's cache: each app reads its own database, so each gets its own (see init_app)
+cache = LocalProxy(lambda: current_app.extensions['odds.cache'])
+
+# Sent, with the app as sender, after a committed price or market change in the process that made it
+changed = signal('odds-changed')
+
+
+def notify():
+    """Refresh the cache and tell in-process listeners; call after committing a change."""
+    cache.invalidate()
+    changed.send(current_app._get_current_object())
+
+
+def bump_version():
+    state = db.session.get(OddsState, ODDS_STATE_ID)
+    if state is None:
+        db.session.add(OddsState(id=ODDS_STATE_ID, version=1))
+    else:
+        db.session.execute(
+            update(OddsState).where(OddsState.id == ODDS_STATE_ID).values(version=OddsState.version + 1)
+        )
+
+
+def set_odds(selection_id, odds):
+    """Reprice a selection and commit. Returns the new odds version."""
+    if odds <= 1:
+        raise ValueError('Decimal odds must be greater than 1')
+    selection = db.session.get(Selection, selection_id)
+    if selection is None:
+        raise LookupError(f'No selection {selection_id}')
+    db.session.execute(
+        update(Selection).where(Selection.id == selection_id)
+        .values(odds=odds, odds_version=Selection.odds_version + 1)
+    )
+    bump_version()
+    db.session.commit()
+    notify()
+    return db.session.get(Selection, selection_id).odds_version
+
+
+def create_event(name, prices, sport=None, starts_at=None, featured=False, market_name='Match Winner'):
+    """Create an open event with one market priced from a ``{selection name: odds}`` mapping."""
+    event = Event(name=name, sport=sport, starts_at=starts_at, featured=featured)
+    market = Market(event=event, name=market_name)
+    db.session.add_all([event, market])
+    for selection_name, price in prices.items():
+        db.session.add(Selection(market=market, name=selection_name, odds=price))
+    bump_version()
+    db.session.commit()
+    notify()
+    return event
+
+
+def quote(selection_id, odds_version=None):
+    """Return the current price of an open selection for bet placement.
+
+    Raises LookupError if the selection is not open and OddsChanged if the
+    client saw a different ``odds_version`` than the current one.
+    """
+    selection = cache.snapshot(max_age=0).get(selection_id)
+    if selection is None:
+        raise LookupError(f'Selection {selection_id} is not open for betting')
+    if odds_version is not None and odds_version != selection.odds_version:
+        raise OddsChanged()
+    return selection
+
+
+def init_app(app):
+    app.extensions['odds.cache'] = OddsCache()
@@ -0,0 +1,233 @@
+"""Live odds over Server-Sent Events.
+
+One :class:`Broker` per app and process fans price changes out to every connected
+``/odds/stream`` client. A backend feeds it by diffing successive
+:class:`odds.OddsSnapshot` versions:
+
+* ``local`` reacts to :data:`odds.changed`, so it only sees changes made by
+  the same app in the same process (a single-process server, tests);
+* ``database`` polls ``OddsState.version`` every ``ODDS_STREAM_POLL_INTERVAL``
+  seconds, so every gunicorn worker follows the same feed, including prices set
+  from the CLI. It costs one primary-key read per interval per worker, however
+  many clients are connected.
+
+Each client has a bounded mailbox keyed by selection: a newer price replaces a
+pending one, and a client that falls more than ``ODDS_STREAM_QUEUE_SIZE``
+selections behind is told to reload instead of queueing without limit. Streams
+send a comment as heartbeat when idle and end after ``ODDS_STREAM_MAX_AGE``
+seconds; EventSource reconnects on its own, with ``Last-Event-ID`` telling us
+whether it missed anything.
+
+Each open stream holds a whole worker under sync gunicorn workers; the
+gevent workers of ``gunicorn.conf.py`` hold thousands per process, since a
+waiting stream is a greenlet blocked on its condition (see
+``python -m benchmarks streams``). ``gunicorn.conf.py`` therefore sets
+``ODDS_STREAM_ENABLED`` off for worker classes that are not async: the home
+page then keeps the odds it was rendered with, and ``/odds/stream`` answers
+204, which EventSource does not retry.
+"""
+import json
+import os
+import threading
+import time
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+from werkzeug.utils import import_string
+
+from models import db
+import odds
+
+
+class Subscriber:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.version = None
+        self.overflowed = False
+        self._pending = {}
+        self._ready = threading.Condition()
+
+    def put(self, version, updates):
+        with self._ready:
+            if self.overflowed:
+                return
+            self._pending.update(updates)
+            if len(self._pending) > self.maxsize:
+                self.overflowed = True
+                self._pending.clear()
+            self.version = version
+            self._ready.notify()
+
+    def get(self, timeout):
+        """Wait up to ``timeout`` seconds and return ``(version, updates)``; updates may be empty."""
+        with self._ready:
+            if not self._pending and not self.overflowed:
+                self._ready.wait(timeout)
+            updates, self._pending = self._pending, {}
+            return self.version, updates
+
+
+def selection_update(selection):
+    return {'id': selection.id, 'odds': selection.odds, 'odds_version': selection.odds_version}
+
+
+def diff(previous, current):
+    updates = {}
+    for selection_id, selection in current.selections.items():
+        old = previous.get(selection_id)
+        if old is None or old.odds_version != selection.odds_version:
+            updates[selection_id] = selection_update(selection)
+    for selection_id in previous.selections.keys() - current.selections.keys():
+        updates[selection_id] = {'id': selection_id, 'closed': True}
+    return updates
+
+
+class Backend:
+    """Feeds a broker with the difference between consecutive odds snapshots."""
+
+    def __init__(self, app):
+        self.app = app
+        self.snapshot = None
+        self._lock = threading.Lock()
+
+    def start(self, broker):
+        raise NotImplementedError
+
+    def check(self, broker):
+        with self.app.app_context():
+            try:
+                snapshot = odds.cache.snapshot(max_age=0)
+            finally:
+                db.session.remove()
+        with self._lock:
+            previous = self.snapshot
+            if previous is not None and previous.version == snapshot.version:
+                return
+            self.snapshot = snapshot
+        if previous is not None:
+            broker.publish(snapshot.version, diff(previous, snapshot))
+
+
+class LocalBackend(Backend):
+    def start(self, broker):
+        self.check(broker)
+        odds.changed.connect(lambda sender: self.check(broker), sender=self.app, weak=False)
+
+
+class PollingBackend(Backend):
+    def __init__(self, app, interval=1.0):
+        super().__init__(app)
+        self.interval = interval
+
+    def start(self, broker):
+        self.check(broker)
+        threading.Thread(target=self.run, args=(broker,), name='odds-stream-poller', daemon=True).start()
+
+    def run(self, broker):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check(broker)
+            except Exception:
+                self.app.logger.exception('Polling the odds version failed')
+
+
+BACKENDS = {'local': LocalBackend, 'database': PollingBackend}
+
+
+class Broker:
+    def __init__(self, queue_size=256, heartbeat=15.0, min_interval=0.25, max_age=300.0):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.min_interval = min_interval
+        self.max_age = max_age
+        self.make_backend = None
+        self.backend = None
+        self._subscribers = set()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def clients(self):
+        return len(self._subscribers)
+
+    def start(self):
+        # Started lazily and per process: a backend thread does not survive a fork
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._subscribers = set()
+                    self.backend = self.make_backend()
+                    self.backend.start(self)
+                    self._pid = os.getpid()
+        return self.backend
+
+    def subscribe(self):
+        self.start()
+        subscriber = Subscriber(self.queue_size)
+        subscriber.version = self.backend.snapshot.version
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, version, updates):
+        if not updates:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(version, updates)
+
+    def stream(self, last_event_id=None):
+        """Yield SSE frames for one client until ``max_age`` passes or it has to reload."""
+        subscriber = self.subscribe()
+        try:
+            yield f'retry: 3000\nid: {subscriber.version}\nevent: hello\ndata: {{}}\n\n'
+            snapshot = self.backend.snapshot
+            if last_event_id is not None and last_event_id != snapshot.version:
+                # Reconnected after missing updates: resend every price once
+                frame = [selection_update(selection) for selection in snapshot.selections.values()]
+                yield f'id: {snapshot.version}\nevent: odds\ndata: {json.dumps(frame)}\n\n'
+            deadline = time.monotonic() + self.max_age
+            while time.monotonic() < deadline:
+                version, updates = subscriber.get(self.heartbeat)
+                if subscriber.overflowed:
+                    yield 'event: reload\ndata: {}\n\n'
+                    return
+                if not updates:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield f'id: {version}\nevent: odds\ndata: {json.dumps(list(updates.values()))}\n\n'
+                # Let bursts of repricing pile up (and coalesce) before the next frame
+                time.sleep(self.min_interval)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+broker = LocalProxy(lambda: current_app.extensions['odds_stream.broker'])
+
+
+def init_app(app):
+    app.config.setdefault('ODDS_STREAM_ENABLED', True)
+    app.config.setdefault('ODDS_STREAM_BACKEND', 'database')
+    app.config.setdefault('ODDS_STREAM_POLL_INTERVAL', 1.0)
+    broker = app.extensions['odds_stream.broker'] = Broker(
+        app.config.setdefault('ODDS_STREAM_QUEUE_SIZE', 256),
+        app.config.setdefault('ODDS_STREAM_HEARTBEAT', 15.0),
+        app.config.setdefault('ODDS_STREAM_MIN_INTERVAL', 0.25),
+        app.config.setdefault('ODDS_STREAM_MAX_AGE', 300.0),
+    )
+
+    def make_backend():
+        # Backends are named or given as an import path, built from the config when first needed
+        name = app.config['ODDS_STREAM_BACKEND']
+        cls = BACKENDS.get(name) or import_string(name)
+        if issubclass(cls, PollingBackend):
+            return cls(app, app.config['ODDS_STREAM_POLL_INTERVAL'])
+        return cls(app)
+
+    broker.make_backend = make_backend
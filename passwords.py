@@ -0,0 +1,155 @@
+"""Password hashing off the request thread.
+
+Hashes are computed in a small process pool, so a burst of logins costs pool
+slots instead of web worker CPU. The pool has a bounded number of pending
+jobs and callers are shed with :class:`HashingBusy` when it is full or does
+not answer within ``PASSWORD_HASH_TIMEOUT`` seconds. Failed
+attempts are throttled per client IP and per username, and hashes made with
+an older scheme are upgraded transparently on the next successful login.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class Throttled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Too many attempts, retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(self, method='scrypt', workers=2, max_pending=64, timeout=10):
+        self.configure(method, workers, max_pending, timeout)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, method, workers, max_pending, timeout):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._prefix = None
+        self._dummy_hash = None
+
+    def init_app(self, app):
+        self.configure(
+            app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt'),
+            app.config.setdefault('PASSWORD_HASH_WORKERS', 2),  # 0 hashes inline
+            app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 64),
+            app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10),
+        )
+
+    def executor(self):
+        # Created lazily and per process, so forked gunicorn workers each get their own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self.executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # The pool is too far behind to answer in time, which callers treat like a full one
+            raise HashingBusy() from None
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if pwhash is None:
+            # Spend the same time on unknown users so usernames can't be probed by timing
+            if self._dummy_hash is None:
+                self._dummy_hash = generate_password_hash('', self.method)
+            self.run(check_password_hash, self._dummy_hash, password)
+            return False
+        return self.run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        if self._prefix is None:
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._prefix
+
+
+class AttemptThrottle:
+    """Sliding-window counter of attempts per key.
+
+    At most ``maxkeys`` keys are tracked; the least recently hit are dropped
+    first, so a flood of new keys cannot reset the ones under attack.
+    """
+
+    def __init__(self, limit, window, maxkeys=100000):
+        # Keys are tuples such as ('ip', addr) or ('user', name)
+        self.limit = limit
+        self.window = window
+        self.maxkeys = maxkeys
+        self._attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, *keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                attempts = self._attempts.get(key)
+                if not attempts:
+                    continue
+                while attempts and attempts[0] <= now - self.window:
+                    attempts.popleft()
+                if len(attempts) >= self.limit:
+                    raise Throttled(int(attempts[0] + self.window - now) + 1)
+
+    def hit(self, *keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._attempts.setdefault(key, deque(maxlen=self.limit)).append(now)
+                self._attempts.move_to_end(key)
+            while len(self._attempts) > self.maxkeys:
+                self._attempts.popitem(last=False)
+
+    def reset(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._attempts.pop(key, None)
+
+
+hasher = LocalProxy(lambda: current_app.extensions['passwords.hasher'])
+login_user_throttle = LocalProxy(lambda: current_app.extensions['passwords.login_user_throttle'])
+login_ip_throttle = LocalProxy(lambda: current_app.extensions['passwords.login_ip_throttle'])
+register_throttle = LocalProxy(lambda: current_app.extensions['passwords.register_throttle'])
+
+
+def init_app(app):
+    hasher = app.extensions['passwords.hasher'] = PasswordHasher()
+    hasher.init_app(app)
+    window = app.config.setdefault('LOGIN_ATTEMPT_WINDOW', 300)
+    app.extensions['passwords.login_user_throttle'] = AttemptThrottle(
+        app.config.setdefault('LOGIN_ATTEMPTS_PER_USER', 5), window)
+    app.extensions['passwords.login_ip_throttle'] = AttemptThrottle(
+        app.config.setdefault('LOGIN_ATTEMPTS_PER_IP', 20), window)
+    app.extensions['passwords.register_throttle'] = AttemptThrottle(
+        app.config.setdefault('REGISTER_ATTEMPT_LIMIT', 10), app.config.setdefault('REGISTER_ATTEMPT_WINDOW', 3600))
@@ -0,0 +1,216 @@
+"""Request rate limits declared on the routes.
+
+::
+
+    @bp.route('/place_bet', methods=['POST'])
+    @ratelimit.limit('bet', '30/minute')
+    @login_required
+    def place_bet(): ...
+
+Each policy counts requests per key (the user, or the client IP for anonymous
+requests and for ``key=ratelimit.by_ip``) with a sliding window: the hits of
+the current fixed window plus the previous window's hits weighted by how much
+of it still overlaps, which needs two counters per key instead of a timestamp
+per request. A request over the limit is answered with 429 and Retry-After
+before the view runs, so it never reaches the database. Routes sharing a policy
+name share its budget; ``RATELIMIT_POLICIES = {'bet': '10/minute'}`` overrides
+a rate without touching the code.
+
+``RATELIMIT_BACKEND`` picks the counter store:
+
+``local``
+    An LRU of ``maxkeys`` counters in each worker process. Every worker
+    enforces the limit on its own.
+``sqlite``
+    A small SQLite file shared by the workers on one host
+    (``RATELIMIT_STORAGE_PATH``, by default in the temp dir; ``/dev/shm``
+    keeps it in memory). It is separate from the application database, so
+    counting never competes with the ledger for its write lock.
+
+A store that fails lets the request through rather than take the site down.
+``RATELIMIT_ENABLED = False`` turns limiting off, e.g. for benchmarks.
+"""
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.local import LocalProxy
+
+UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate):
+    """``'30/minute'`` or ``'100/5 minutes'`` to ``(30, 60)`` or ``(100, 300)``.
+
+    Both numbers must be at least 1: a limit of 0 leaves :func:`retry_after`
+    nothing to wait for, and a window of 0 nothing to divide by.
+    """
+    count, _, period = rate.partition('/')
+    number, _, unit = period.strip().rpartition(' ')
+    unit = unit.rstrip('s')
+    if (not count.strip().isdigit() or not int(count) or unit not in UNITS
+            or (number and not (number.isdigit() and int(number)))):
+        raise ValueError(f'Invalid rate {rate!r}')
+    return int(count), int(number or 1) * UNITS[unit]
+
+
+def retry_after(limit, window, elapsed, previous, current):
+    """Seconds until one more hit fits the window, or 0 if it fits now."""
+    if previous * (window - elapsed) / window + current <= limit - 1:
+        return 0
+    if current <= limit - 1:
+        # Wait for enough of the previous window to slide out
+        wait = (1 - (limit - 1 - current) / previous) * window - elapsed
+    else:
+        # Wait for the next window, where this one's hits become the previous ones
+        wait = window - elapsed + (1 - (limit - 1) / current) * window
+    return max(1, math.ceil(wait))
+
+
+class LocalStore:
+    def __init__(self, maxkeys=100000):
+        self.maxkeys = maxkeys
+        self._counters = OrderedDict()  # key: [slot, previous hits, current hits], least recently hit first
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now):
+        slot, elapsed = divmod(now, window)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or counter[0] < slot - 1:
+                previous, current = 0, 0
+            elif counter[0] == slot - 1:
+                previous, current = counter[2], 0
+            else:
+                previous, current = counter[1], counter[2]
+            wait = retry_after(limit, window, elapsed, previous, current)
+            if not wait:
+                self._counters[key] = [slot, previous, current + 1]
+                self._counters.move_to_end(key)
+                if len(self._counters) > self.maxkeys:
+                    self._counters.popitem(last=False)
+            return wait
+
+
+class SqliteStore:
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._next_purge = 0
+
+    def connection(self):
+        # One connection per process, opened again in forked workers. Hits take the lock, so
+        # threads (or gevent greenlets, which a thread-local would give a connection each) share it
+        if self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_limit (key TEXT NOT NULL, slot INTEGER NOT NULL, '
+                               'expires REAL NOT NULL, hits INTEGER NOT NULL, PRIMARY KEY (key, slot)) '
+                               'WITHOUT ROWID')
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def hit(self, key, limit, window, now):
+        slot, elapsed = divmod(now, window)
+        slot = int(slot)
+        with self._lock:
+            connection = self.connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                hits = dict(connection.execute('SELECT slot, hits FROM rate_limit WHERE key = ? AND slot >= ?',
+                                               (key, slot - 1)))
+                wait = retry_after(limit, window, elapsed, hits.get(slot - 1, 0), hits.get(slot, 0))
+                if not wait:
+                    connection.execute('INSERT INTO rate_limit (key, slot, expires, hits) VALUES (?, ?, ?, 1) '
+                                       'ON CONFLICT (key, slot) DO UPDATE SET hits = hits + 1',
+                                       (key, slot, (slot + 2) * window))
+                if now >= self._next_purge:
+                    self._next_purge = now + self.PURGE_INTERVAL
+                    connection.execute('DELETE FROM rate_limit WHERE expires < ?', (now,))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        return wait
+
+
+BACKENDS = {'local', 'sqlite'}
+
+
+def by_ip():
+    return f'ip:{request.remote_addr}'
+
+
+def by_user():
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    return by_ip()
+
+
+class RateLimiter:
+    def __init__(self):
+        self.enabled = True
+        self.policies = {}
+        self.store = LocalStore()
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault('RATELIMIT_ENABLED', True)
+        self.policies = {name: parse_rate(rate)
+                         for name, rate in app.config.setdefault('RATELIMIT_POLICIES', {}).items()}
+        backend = app.config.setdefault('RATELIMIT_BACKEND', 'local')
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown RATELIMIT_BACKEND {backend!r}, expected one of {sorted(BACKENDS)}')
+        if backend == 'sqlite':
+            self.store = SqliteStore(app.config.setdefault(
+                'RATELIMIT_STORAGE_PATH', os.path.join(tempfile.gettempdir(), 'bettingking-ratelimit.db')))
+        else:
+            self.store = LocalStore()
+
+    def check(self, name, rate, key):
+        """Count a hit of policy ``name`` for ``key``, raising TooManyRequests if it is over the limit."""
+        if not self.enabled:
+            return
+        limit, window = self.policies.get(name) or rate
+        try:
+            wait = self.store.hit(f'{name}:{key}', limit, window, time.time())
+        except sqlite3.Error:
+            current_app.logger.exception('Rate limit store failed, letting the request through')
+            return
+        if wait:
+            raise TooManyRequests(f'Too many requests, please try again in {wait} seconds.', retry_after=wait)
+
+
+# Each app counts against its own store and policies (see init_app)
+limiter = LocalProxy(lambda: current_app.extensions['ratelimit.limiter'])
+
+
+def limit(name, rate, key=by_user, methods=('POST',)):
+    """Limit a view to ``rate`` requests per ``key()`` for the given HTTP methods."""
+    rate = parse_rate(rate)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method in methods:
+                limiter.check(name, rate, key())
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def init_app(app):
+    limiter = app.extensions['ratelimit.limiter'] = RateLimiter()
+    limiter.init_app(app)
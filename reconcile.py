@@ -0,0 +1,178 @@
+"""Balance reconciliation.
+
+Every user's balance is recomputed two independent ways and compared with
+``User.balance_cents``:
+
+* from the ledger: the sum of the legs posted to the user's account;
+* from the history: deposits, less withdrawals that did not fail, less the
+  stakes of bets and slips, plus what settled bets and slips paid out
+  (archived bets and transactions included).
+
+Rows are streamed in chunks of plain tuples (no ORM objects) into NumPy arrays
+and summed per user with ``np.bincount`` over the user ids of the range being
+checked. Bet payouts are worked out for a whole chunk at once, floored to the
+cent like :func:`settlement.payout_cents`. Ranges of user ids are independent,
+so :func:`run` can spread them over forked worker processes.
+
+:func:`details` lists the rows behind one drifted balance.
+"""
+import multiprocessing
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from sqlalchemy import select, case, func
+
+from models import db, User, Bet, ArchivedBet, BetSlip, Transaction, ArchivedTransaction, LedgerEntry
+from settlement import payout_cents
+import ledger
+
+DEFAULT_RANGE_SIZE = 50000
+DEFAULT_CHUNK_SIZE = 100000
+
+Drift = namedtuple('Drift', 'user_id balance_cents ledger_cents expected_cents')
+Finding = namedtuple('Finding', 'kind reference expected_cents found_cents')
+
+
+def chunks(statement, chunk_size):
+    """Yield the rows of ``statement`` as float arrays of up to ``chunk_size`` rows (NULL becomes NaN)."""
+    # Core rows rather than ORM results, as plain tuples: numpy probes Row objects key by key
+    result = db.session.connection().execute(statement.execution_options(yield_per=chunk_size))
+    for rows in result.partitions():
+        yield np.array(list(map(tuple, rows)), dtype=np.float64)
+
+
+def bet_net(chunk):
+    """What each bet in a ``(user_id, amount_cents, odds, result)`` chunk did to the balance."""
+    amounts, prices, results = chunk[:, 1], chunk[:, 2], chunk[:, 3]
+    won = np.where(np.isnan(prices), amounts * 2, np.floor(np.round(amounts * np.nan_to_num(prices), 6)))
+    return np.select([results == 1, results == 2], [won, amounts], 0) - amounts
+
+
+def check_range(low, high, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Reconcile the users with ids from ``low`` to ``high``; returns ``(checked, [Drift])``."""
+    size = high - low + 1
+
+    def totals(statement, values=lambda chunk: chunk[:, 1]):
+        total = np.zeros(size)
+        for chunk in chunks(statement, chunk_size):
+            total += np.bincount((chunk[:, 0] - low).astype(np.int64), weights=values(chunk), minlength=size)
+        return total
+
+    exists = np.zeros(size, dtype=bool)
+    balances = np.zeros(size)
+    for chunk in chunks(select(User.id, User.balance_cents).where(User.id.between(low, high)), chunk_size):
+        rows = (chunk[:, 0] - low).astype(np.int64)
+        exists[rows] = True
+        balances[rows] = chunk[:, 1]
+
+    ledgers = totals(select(LedgerEntry.user_id, LedgerEntry.amount_cents)
+                     .where(LedgerEntry.user_id.between(low, high), LedgerEntry.account.like('user:%')))
+    expected = np.zeros(size)
+    for model in (Transaction, ArchivedTransaction):
+        expected += totals(
+            select(model.user_id,
+                   case((model.type == 'deposit', model.amount_cents),
+                        (model.status == 'Failed', 0),  # refunded
+                        else_=-model.amount_cents))
+            .where(model.user_id.between(low, high))
+        )
+    for model in (Bet, ArchivedBet):
+        expected += totals(
+            select(model.user_id, model.amount_cents, model.odds,
+                   case((model.result == 'Win', 1), (model.result == 'Void', 2), else_=0))
+            .where(model.user_id.between(low, high)),
+            bet_net,
+        )
+    expected += totals(
+        select(BetSlip.user_id, func.coalesce(BetSlip.returned_cents, 0) - BetSlip.total_stake_cents)
+        .where(BetSlip.user_id.between(low, high))
+    )
+
+    balances, ledgers, expected = (np.rint(values).astype(np.int64) for values in (balances, ledgers, expected))
+    drifted = np.flatnonzero(exists & ((balances != ledgers) | (balances != expected)))
+    return int(exists.sum()), [Drift(low + int(row), int(balances[row]), int(ledgers[row]), int(expected[row]))
+                               for row in drifted]
+
+
+def ranges(range_size):
+    low, high = db.session.execute(select(func.min(User.id), func.max(User.id))).one()
+    if low is None:
+        return []
+    return [(start, min(start + range_size - 1, high)) for start in range(low, high + 1, range_size)]
+
+
+def run(app, processes=1, range_size=DEFAULT_RANGE_SIZE, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Reconcile every user, ``processes`` id ranges at a time. Returns ``(checked, [Drift])``."""
+    tasks = [(low, high, chunk_size) for low, high in ranges(range_size)]
+    checked, drifts = 0, []
+
+    def collect(result):
+        nonlocal checked
+        checked += result[0]
+        drifts.extend(result[1])
+        if progress:
+            progress(checked)
+
+    if processes == 1 or len(tasks) < 2:
+        for task in tasks:
+            collect(check_range(*task))
+    else:
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes, initializer=start_worker, initargs=(app,)) as pool:
+            for result in pool.imap_unordered(check_task, tasks):
+                collect(result)
+    return checked, sorted(drifts)
+
+
+def start_worker(app):
+    app.app_context().push()
+    # Pooled connections inherited from the parent must not be shared
+    for engine in db.engines.values():
+        engine.dispose(close=False)
+
+
+def check_task(task):
+    return check_range(*task)
+
+
+def details(user_id):
+    """Why ``user_id``'s balance drifted, as :class:`Finding` rows.
+
+    Each bet, slip and transaction is matched with the ledger postings that
+    reference it; any that are missing or for the wrong amount are listed, as
+    are postings no row accounts for. Settlement payouts are posted per run
+    rather than per bet, so they are compared as one total.
+    """
+    found = defaultdict(int)
+    entries = select(LedgerEntry.kind, LedgerEntry.reference, LedgerEntry.amount_cents).where(
+        LedgerEntry.user_id == user_id, LedgerEntry.account == ledger.user_account(user_id))
+    for kind, reference, amount_cents in db.session.execute(entries):
+        found[kind, reference] += amount_cents
+
+    expected = defaultdict(int)
+    bets = [select(model.id, model.amount_cents, model.odds, model.result).where(model.user_id == user_id)
+            for model in (Bet, ArchivedBet)]
+    for bet_id, amount_cents, price, result in (row for query in bets for row in db.session.execute(query)):
+        expected['stake', f'bet:{bet_id}'] -= amount_cents
+        if result in ('Win', 'Void'):
+            expected['payout', None] += payout_cents(amount_cents, result, price)
+    for slip_id, total_stake_cents, returned_cents in db.session.execute(
+            select(BetSlip.id, BetSlip.total_stake_cents, BetSlip.returned_cents).where(BetSlip.user_id == user_id)):
+        expected['stake', f'slip:{slip_id}'] -= total_stake_cents
+        expected['payout', None] += returned_cents or 0
+    transactions = [select(model.id, model.type, model.amount_cents, model.status).where(model.user_id == user_id)
+                    for model in (Transaction, ArchivedTransaction)]
+    for transaction_id, kind, amount_cents, status in (row for query in transactions
+                                                       for row in db.session.execute(query)):
+        reference = f'transaction:{transaction_id}'
+        if kind == 'deposit':
+            expected['deposit', reference] += amount_cents
+        else:
+            expected['withdrawal', reference] -= amount_cents
+            if status == 'Failed':
+                expected['refund', reference] += amount_cents
+
+    found['payout', None] = sum(found.pop(key) for key in [key for key in found if key[0] == 'payout'])
+    return [Finding(kind, reference, expected[kind, reference], found[kind, reference])
+            for kind, reference in sorted(set(expected) | set(found), key=lambda key: (key[0], key[1] or ''))
+            if expected[kind, reference] != found[kind, reference]]
@@ -0,0 +1,227 @@
+"""Liability exposure per selection and event.
+
+``Selection.stake_cents`` and ``liability_cents`` hold the stakes and the
+potential payouts of the pending bets on each selection. They move with
+set-based UPDATEs in the same transaction as the bet or the settlement, and a
+reservation against ``liability_limit_cents`` is a conditional UPDATE, so a
+limit holds across every worker without reading the ``Bet`` table.
+
+:data:`index` is the current app's per-process copy for O(1) reads. Changes this process
+commits are applied right after the commit, and the whole index is reloaded
+from the selection counters every ``RISK_INDEX_MAX_AGE`` seconds to pick up
+other workers' bets. :func:`recompute` rebuilds the counters themselves from
+the pending bets and slips.
+
+A slip's potential return counts against every one of its legs, which
+overstates accumulator exposure but never understates it.
+"""
+import os
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from flask import current_app
+from sqlalchemy import event, select, update, bindparam, func, or_
+from sqlalchemy.orm import Session
+from werkzeug.local import LocalProxy
+
+from models import db, Bet, BetSlip, SlipLeg, Market, Selection
+from money import from_cents
+
+
+class Exposure(namedtuple('Exposure', 'stake_cents liability_cents limit_cents')):
+    def to_dict(self):
+        return {
+            'stake': str(from_cents(self.stake_cents)),
+            'liability': str(from_cents(self.liability_cents)),
+            'limit': str(from_cents(self.limit_cents)) if self.limit_cents is not None else None,
+        }
+
+
+class LimitExceeded(Exception):
+    def __init__(self, selection_id):
+        super().__init__(f'Selection {selection_id} has reached its liability limit')
+        self.selection_id = selection_id
+
+
+def pending_changes(session):
+    return session.info.setdefault('risk_changes', defaultdict(lambda: [0, 0]))
+
+
+def reserve(selection_id, stake_cents, liability_cents):
+    """Add a bet to a selection's exposure, raising LimitExceeded if it would pass the limit.
+
+    Does not commit.
+    """
+    result = db.session.execute(
+        update(Selection)
+        .where(Selection.id == selection_id,
+               or_(Selection.liability_limit_cents.is_(None),
+                   Selection.liability_cents + liability_cents <= Selection.liability_limit_cents))
+        .values(stake_cents=Selection.stake_cents + stake_cents,
+                liability_cents=Selection.liability_cents + liability_cents)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise LimitExceeded(selection_id)
+    change = pending_changes(db.session)[selection_id]
+    change[0] += stake_cents
+    change[1] += liability_cents
+
+
+def release_many(released):
+    """Take settled bets off their selections, from ``{selection_id: (stake_cents, liability_cents)}``.
+
+    Does not commit.
+    """
+    released = {selection_id: amounts for selection_id, amounts in released.items() if selection_id is not None}
+    if not released:
+        return
+    table = Selection.__table__
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('sid'))
+        .values(stake_cents=table.c.stake_cents - bindparam('stake'),
+                liability_cents=table.c.liability_cents - bindparam('liability')),
+        [{'sid': selection_id, 'stake': stake, 'liability': liability}
+         for selection_id, (stake, liability) in released.items()],
+    )
+    changes = pending_changes(db.session)
+    for selection_id, (stake, liability) in released.items():
+        changes[selection_id][0] -= stake
+        changes[selection_id][1] -= liability
+
+
+class LiabilityIndex:
+    def __init__(self, max_age=5.0):
+        self.max_age = max_age
+        self._selections = {}  # selection id: [stake, liability, limit, event id]
+        self._events = {}  # event id: [stake, liability]
+        self._loaded_at = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        rows = db.session.execute(
+            select(Selection.id, Market.event_id, Selection.stake_cents, Selection.liability_cents,
+                   Selection.liability_limit_cents)
+            .join(Market, Market.id == Selection.market_id)
+            .where(or_(Selection.status == 'Open', Selection.liability_cents != 0))
+        ).all()
+        selections, events = {}, {}
+        for selection_id, event_id, stake, liability, limit in rows:
+            selections[selection_id] = [stake, liability, limit, event_id]
+            totals = events.setdefault(event_id, [0, 0])
+            totals[0] += stake
+            totals[1] += liability
+        with self._lock:
+            self._selections, self._events = selections, events
+            self._loaded_at = time.monotonic()
+            self._pid = os.getpid()
+
+    def fresh(self):
+        if (self._loaded_at is None or self._pid != os.getpid()
+                or time.monotonic() - self._loaded_at >= self.max_age):
+            self.load()
+        return self
+
+    def apply(self, changes):
+        with self._lock:
+            for selection_id, (stake, liability) in changes.items():
+                entry = self._selections.get(selection_id)
+                if entry is None:
+                    self._loaded_at = None  # a selection we have not loaded yet
+                    continue
+                entry[0] += stake
+                entry[1] += liability
+                totals = self._events[entry[3]]
+                totals[0] += stake
+                totals[1] += liability
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def selection(self, selection_id):
+        entry = self.fresh()._selections.get(selection_id)
+        return Exposure(*entry[:3]) if entry else None
+
+    def event(self, event_id):
+        totals = self.fresh()._events.get(event_id)
+        return Exposure(totals[0], totals[1], None) if totals else None
+
+    def top(self, count=20):
+        """The ``count`` selections with the highest liability, as ``(selection_id, Exposure)``."""
+        with self.fresh()._lock:
+            items = [(selection_id, Exposure(*entry[:3])) for selection_id, entry in self._selections.items()]
+        return sorted(items, key=lambda item: item[1].liability_cents, reverse=True)[:count]
+
+
+index = LocalProxy(lambda: current_app.extensions['risk.index'])
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_committed(session):
+    changes = session.info.pop('risk_changes', None)
+    if changes:
+        index.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_rolled_back(session):
+    session.info.pop('risk_changes', None)
+
+
+def recompute():
+    """Rebuild every selection's counters from the pending bets and open slips, and commit.
+
+    Bets placed while this runs can be missed, so run it with betting paused.
+    """
+    from settlement import payout_cents
+
+    totals = defaultdict(lambda: [0, 0])
+    bets = select(Bet.selection_id, Bet.amount_cents, Bet.odds).where(
+        Bet.result == 'Pending', Bet.selection_id.is_not(None))
+    for selection_id, amount_cents, price in db.session.execute(bets.execution_options(yield_per=10000)):
+        totals[selection_id][0] += amount_cents
+        totals[selection_id][1] += payout_cents(amount_cents, 'Win', price)
+    slip_legs = (
+        select(SlipLeg.selection_id, func.sum(BetSlip.total_stake_cents), func.sum(BetSlip.potential_return_cents))
+        .join(BetSlip, BetSlip.id == SlipLeg.slip_id)
+        .where(BetSlip.status == 'Open')
+        .group_by(SlipLeg.selection_id)
+    )
+    for selection_id, stake, liability in db.session.execute(slip_legs):
+        totals[selection_id][0] += stake
+        totals[selection_id][1] += liability
+
+    db.session.execute(update(Selection).values(stake_cents=0, liability_cents=0))
+    if totals:
+        table = Selection.__table__
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('sid'))
+            .values(stake_cents=bindparam('stake'), liability_cents=bindparam('liability')),
+            [{'sid': selection_id, 'stake': stake, 'liability': liability}
+             for selection_id, (stake, liability) in totals.items()],
+        )
+    db.session.commit()
+    index.invalidate()
+    return len(totals)
+
+
+def set_limit(selection_id, limit_cents):
+    """Set (or with None, remove) a selection's liability limit and commit; returns its :class:`Exposure`.
+
+    Read from the row rather than the index, which leaves out closed selections with nothing at stake.
+    """
+    row = db.session.execute(
+        update(Selection).where(Selection.id == selection_id).values(liability_limit_cents=limit_cents)
+        .returning(Selection.stake_cents, Selection.liability_cents, Selection.liability_limit_cents)
+    ).first()
+    if row is None:
+        raise LookupError(f'No selection {selection_id}')
+    db.session.commit()
+    index.invalidate()
+    return Exposure(*row)
+
+
+def init_app(app):
+    app.extensions['risk.index'] = LiabilityIndex(app.config.setdefault('RISK_INDEX_MAX_AGE', 5.0))
@@ -0,0 +1,181 @@
+"""Bulk bet settlement.
+
+An outcome maps predictions to results, e.g. ``{'Team A': 'Win', 'Team B': 'Lose'}``,
+or, for a market, selection ids to results. Pending bets on those keys are settled in id-ordered chunks: each chunk
+is one set-based ``UPDATE ... RETURNING`` per result plus one aggregated credit
+per user, committed together with the run's progress. Market runs then settle
+the bet slips with legs in the market (see :mod:`slips`). A run that is
+interrupted picks up after ``SettlementRun.last_bet_id`` / ``last_slip_id``.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_DOWN
+
+from sqlalchemy import select, update
+
+from models import db, Bet, Market, Selection, SettlementRun
+import ledger
+import odds
+import risk
+import slips
+import user_stats
+
+# Multiple of the stake paid back for each result. Wins on bets placed at a
+# price pay the price; legacy free-text bets assume a 2x payout.
+PAYOUTS = {'Win': 2, 'Lose': 0, 'Void': 1}
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def payout_cents(amount_cents, result, price=None):
+    if result == 'Win' and price:
+        return int((Decimal(amount_cents) * Decimal(str(price))).to_integral_value(ROUND_DOWN))
+    return amount_cents * PAYOUTS[result]
+
+
+def normalize_outcomes(outcomes):
+    normalized = {}
+    for key, result in outcomes.items():
+        result = str(result).capitalize()
+        if result not in PAYOUTS:
+            raise ValueError(f'Unknown result {result!r} for {key!r}')
+        normalized[str(key)] = result
+    if not normalized:
+        raise ValueError('No outcomes given')
+    return normalized
+
+
+def target(run):
+    """Bet column a run's outcome keys refer to, and the keys in that column's type."""
+    if run.market_id is not None:
+        return Bet.selection_id, {int(key): result for key, result in run.outcomes.items()}
+    return Bet.prediction, run.outcomes
+
+
+def settle_ids(bet_ids, outcomes, reference, key=Bet.prediction):
+    """Settle the still-pending bets among ``bet_ids`` and credit their owners.
+
+    Only rows that were actually moved out of Pending by this statement are
+    paid, so racing settlements can never pay a bet twice. Does not commit.
+    Returns ``(settled_count, credited_cents)``.
+    """
+    by_result = defaultdict(list)
+    for value, result in outcomes.items():
+        by_result[result].append(value)
+
+    settled = 0
+    credits = defaultdict(int)
+    deltas = defaultdict(lambda: defaultdict(int))
+    released = defaultdict(lambda: [0, 0])
+    for result, values in by_result.items():
+        rows = db.session.execute(
+            update(Bet)
+            .where(Bet.id.in_(bet_ids), key.in_(values), Bet.result == 'Pending')
+            .values(result=result)
+            .returning(Bet.user_id, Bet.amount_cents, Bet.odds, Bet.selection_id),
+            execution_options={'synchronize_session': False},
+        ).all()
+        settled += len(rows)
+        for user_id, amount_cents, price, selection_id in rows:
+            payout = payout_cents(amount_cents, result, price)
+            released[selection_id][0] += amount_cents
+            released[selection_id][1] += payout_cents(amount_cents, 'Win', price)
+            credits[user_id] += payout
+            user_deltas = deltas[user_id]
+            user_deltas['open_exposure_cents'] -= amount_cents
+            if result == 'Win':
+                user_deltas['bets_won'] += 1
+                user_deltas['total_won_cents'] += payout
+            elif result == 'Lose':
+                user_deltas['bets_lost'] += 1
+            else:
+                user_deltas['bets_void'] += 1
+                user_deltas['total_refunded_cents'] += payout
+
+    ledger.credit_many(credits, 'payout', reference, ledger.HOUSE_BETS)
+    ledger.touch(user_id for user_id in deltas if not credits[user_id])  # losers were not credited
+    user_stats.bump_many(deltas)
+    risk.release_many(released)
+    return settled, sum(credits.values())
+
+
+def start_run(outcomes):
+    run = SettlementRun(outcomes=normalize_outcomes(outcomes))
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+
+def start_market_run(market_id, winners=(), void=False):
+    """Start settling a market: ``winners`` win, every other selection loses (or all are void)."""
+    market = db.session.get(Market, market_id)
+    if market is None:
+        raise ValueError(f'No market {market_id}')
+    winners = {int(winner) for winner in winners}
+    selection_ids = [selection.id for selection in market.selections]
+    if not void and not winners:
+        raise ValueError('No winning selection given')
+    if not winners <= set(selection_ids):
+        raise ValueError(f'Selections {sorted(winners - set(selection_ids))} are not in market {market_id}')
+
+    outcomes = {
+        str(selection_id): 'Void' if void else ('Win' if selection_id in winners else 'Lose')
+        for selection_id in selection_ids
+    }
+    # Stop taking bets before settling so the run cannot race new stakes.
+    market.status = 'Settled'
+    db.session.execute(update(Selection).where(Selection.market_id == market_id).values(status='Settled'))
+    odds.bump_version()
+    run = SettlementRun(market_id=market_id, outcomes=outcomes)
+    db.session.add(run)
+    db.session.commit()
+    odds.notify()
+    return run
+
+
+def settle_chunk(run, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Settle the next chunk of ``run`` and commit. Returns the number of bets settled."""
+    if chunk_size < 1:
+        # An empty chunk would mark the run Completed with its bets still pending
+        raise ValueError('chunk_size must be at least 1')
+    key, outcomes = target(run)
+    bet_ids = db.session.scalars(
+        select(Bet.id)
+        .where(key.in_(list(outcomes)), Bet.result == 'Pending', Bet.id > run.last_bet_id)
+        .order_by(Bet.id)
+        .limit(chunk_size)
+    ).all()
+    if not bet_ids:
+        if run.market_id is not None:
+            # Bet slips with legs in the market are settled once the single bets are done
+            last_slip_id, settled, credited = slips.settle_chunk(
+                outcomes, f'settlement:{run.id}', run.last_slip_id, chunk_size)
+            if last_slip_id is not None:
+                run.last_slip_id = last_slip_id
+                run.settled_count += settled
+                run.credited_cents += credited
+                db.session.commit()
+                return settled
+        run.status = 'Completed'
+        db.session.commit()
+        return 0
+
+    settled, credited = settle_ids(bet_ids, outcomes, f'settlement:{run.id}', key)
+    run.last_bet_id = bet_ids[-1]
+    run.settled_count += settled
+    run.credited_cents += credited
+    db.session.commit()
+    return settled
+
+
+def settle(run, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, max_chunks=None):
+    """Settle ``run`` to completion, or for at most ``max_chunks`` chunks, calling ``progress(run)`` after each."""
+    if chunk_size < 1 or (max_chunks is not None and max_chunks < 1):
+        raise ValueError('chunk_size and max_chunks must be at least 1')
+    if run.status == 'Completed':
+        return run
+    run.status = 'Running'
+    chunks = 0
+    while run.status != 'Completed' and (max_chunks is None or chunks < max_chunks):
+        if settle_chunk(run, chunk_size) and progress:
+            progress(run)
+        chunks += 1
+    return run
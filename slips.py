@@ -0,0 +1,259 @@
+"""Bet slips: singles, accumulators and system bets over several selections.
+
+A slip's system expands its legs into combinations: ``singles`` is one bet per
+leg, ``accumulator`` one bet on all of them, ``K/N`` every K-fold of N legs,
+and the named full-cover systems (Trixie, Yankee, Heinz, ...) every double and
+up. The unit stake goes on each combination.
+
+Returns are computed with NumPy instead of a Python loop per slip and leg.
+Slips of the same shape (leg count and system) are stacked into a
+``slips x legs`` matrix of price factors (the odds for a winning leg, 1 for a
+void and 0 for a loser) and multiplied out through the system's
+``combinations x legs`` mask, so pricing or settling a chunk of thousands of
+slips is a few array operations per shape. Each combination's return is
+floored to the cent like :func:`settlement.payout_cents`, after rounding away
+float noise (``100 * 1.15 == 114.99999999999999``).
+"""
+import itertools
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import select, update, case
+
+from models import db, BetSlip, SlipLeg
+from money import MAX_RETURN
+import ledger
+import odds
+import risk
+import user_stats
+
+MAX_LEGS = 8
+MAX_RETURN_CENTS = int(MAX_RETURN * 100)
+DEFAULT_CHUNK_SIZE = 1000
+
+# name: (legs, combination sizes)
+NAMED_SYSTEMS = {
+    'trixie': (3, (2, 3)),
+    'patent': (3, (1, 2, 3)),
+    'yankee': (4, (2, 3, 4)),
+    'lucky15': (4, (1, 2, 3, 4)),
+    'canadian': (5, (2, 3, 4, 5)),
+    'lucky31': (5, (1, 2, 3, 4, 5)),
+    'heinz': (6, (2, 3, 4, 5, 6)),
+    'lucky63': (6, (1, 2, 3, 4, 5, 6)),
+    'super_heinz': (7, (2, 3, 4, 5, 6, 7)),
+    'goliath': (8, (2, 3, 4, 5, 6, 7, 8)),
+}
+
+PENDING, WIN, LOSE, VOID = range(4)
+RESULT_CODES = {'Pending': PENDING, 'Win': WIN, 'Lose': LOSE, 'Void': VOID}
+
+
+def combination_sizes(system, legs):
+    if system == 'singles':
+        return (1,)
+    if system == 'accumulator':
+        if legs < 2:
+            raise ValueError('An accumulator needs at least two legs')
+        return (legs,)
+    if system in NAMED_SYSTEMS:
+        required, sizes = NAMED_SYSTEMS[system]
+        if legs != required:
+            raise ValueError(f'A {system} needs exactly {required} legs')
+        return sizes
+    size, _, total = system.partition('/')
+    if size.isdigit() and total.isdigit() and int(total) == legs and 1 <= int(size) <= legs:
+        return (int(size),)
+    raise ValueError(f'Unknown system {system!r} for {legs} legs')
+
+
+@lru_cache(maxsize=None)
+def combination_mask(legs, sizes):
+    """Read-only ``combinations x legs`` boolean matrix with one row per combination."""
+    combinations = [combo for size in sizes for combo in itertools.combinations(range(legs), size)]
+    mask = np.zeros((len(combinations), legs), dtype=bool)
+    for row, combo in enumerate(combinations):
+        mask[row, list(combo)] = True
+    mask.setflags(write=False)
+    return mask
+
+
+def leg_factors(prices, results):
+    """Multiple of the stake each leg carries forward: its price, 1 if void, 0 if lost."""
+    return np.select([results == LOSE, results == VOID], [0.0, 1.0], prices)
+
+
+def returns_cents(stakes, factors, mask):
+    """Total return of each slip from ``stakes`` (slips,) and ``factors`` (slips x legs)."""
+    products = np.where(mask, factors[:, None, :], 1.0).prod(axis=2)
+    per_combination = np.floor(np.round(stakes[:, None] * products, 6))
+    totals = per_combination.sum(axis=1)
+    # astype wraps anything past int64 round to a negative number instead of failing
+    if totals.size and not totals.max() < 2.0 ** 63:
+        raise OverflowError('Slip return does not fit in 64 bits')
+    return totals.astype(np.int64)
+
+
+def decided(results, mask):
+    """Slips whose every combination has a losing leg or no pending leg left."""
+    lost = ((results == LOSE)[:, None, :] & mask).any(axis=2)
+    pending = ((results == PENDING)[:, None, :] & mask).any(axis=2)
+    return (lost | ~pending).all(axis=1)
+
+
+def price(stake_cents, prices, system):
+    """Return ``(combinations, total_stake_cents, potential_return_cents)`` of a slip.
+
+    Raises ValueError if the slip could return more than :data:`money.MAX_RETURN`.
+    """
+    mask = combination_mask(len(prices), combination_sizes(system, len(prices)))
+    try:
+        potential = int(returns_cents(np.array([stake_cents], dtype=float), np.array([prices], dtype=float), mask)[0])
+    except OverflowError:
+        potential = None
+    # Below 2 ** 53 cents the float sums above are exact integers
+    if potential is None or potential > MAX_RETURN_CENTS:
+        raise ValueError(f'A slip can return at most {MAX_RETURN:,}')
+    return len(mask), stake_cents * len(mask), potential
+
+
+def place(user_id, stake_cents, legs, system='accumulator'):
+    """Place a slip on ``legs``, a list of ``(selection_id, odds_version)``. Does not commit.
+
+    Raises ValueError for an invalid slip and, like :func:`betting.place_bet`,
+    LookupError, :class:`odds.OddsChanged`, :class:`risk.LimitExceeded` or
+    :class:`ledger.InsufficientFunds`.
+    """
+    if not legs:
+        raise ValueError('A slip needs at least one leg')
+    if len(legs) > MAX_LEGS:
+        raise ValueError(f'A slip can have at most {MAX_LEGS} legs')
+    quotes = [odds.quote(selection_id, odds_version) for selection_id, odds_version in legs]
+    if len({quote.id for quote in quotes}) != len(quotes):
+        raise ValueError('Each selection can only be used once per slip')
+    sizes = combination_sizes(system, len(quotes))
+    if max(sizes) > 1 and len({quote.event_id for quote in quotes}) != len(quotes):
+        raise ValueError('Selections from the same event cannot be combined')
+
+    combinations, total_stake_cents, potential_return_cents = price(
+        stake_cents, [quote.odds for quote in quotes], system)
+    for quote in quotes:
+        risk.reserve(quote.id, total_stake_cents, potential_return_cents)
+    slip = BetSlip(user_id=user_id, system=system, combinations=combinations, stake_cents=stake_cents,
+                   total_stake_cents=total_stake_cents, potential_return_cents=potential_return_cents)
+    slip.legs = [SlipLeg(selection_id=quote.id, label=quote.label, odds=quote.odds, odds_version=quote.odds_version)
+                 for quote in quotes]
+    db.session.add(slip)
+    db.session.flush()
+    ledger.debit(user_id, total_stake_cents, 'stake', f'slip:{slip.id}', ledger.HOUSE_BETS)
+    user_stats.bump(user_id, bets_placed=1, total_staked_cents=total_stake_cents,
+                    open_exposure_cents=total_stake_cents)
+    return slip
+
+
+def settle_slips(slip_ids, reference):
+    """Pay out the open slips among ``slip_ids`` whose legs decide them. Does not commit.
+
+    Returns ``(settled_count, credited_cents)``.
+    """
+    slips = db.session.execute(
+        select(BetSlip.id, BetSlip.user_id, BetSlip.system, BetSlip.stake_cents, BetSlip.total_stake_cents,
+               BetSlip.potential_return_cents)
+        .where(BetSlip.id.in_(slip_ids), BetSlip.status == 'Open')
+    ).all()
+    legs = defaultdict(list)
+    selections = defaultdict(list)
+    for slip_id, selection_id, leg_price, result in db.session.execute(
+        select(SlipLeg.slip_id, SlipLeg.selection_id, SlipLeg.odds, SlipLeg.result)
+        .where(SlipLeg.slip_id.in_(slip_ids)).order_by(SlipLeg.slip_id, SlipLeg.id)
+    ):
+        legs[slip_id].append((leg_price, RESULT_CODES[result]))
+        selections[slip_id].append(selection_id)
+
+    shapes = defaultdict(list)
+    for slip in slips:
+        shapes[len(legs[slip.id]), combination_sizes(slip.system, len(legs[slip.id]))].append(slip)
+
+    returns = {}
+    for (leg_count, sizes), group in shapes.items():
+        mask = combination_mask(leg_count, sizes)
+        prices = np.array([[leg[0] for leg in legs[slip.id]] for slip in group], dtype=float)
+        results = np.array([[leg[1] for leg in legs[slip.id]] for slip in group], dtype=np.int8)
+        stakes = np.array([slip.stake_cents for slip in group], dtype=float)
+        done = decided(results, mask)
+        if not done.any():
+            continue
+        paid = returns_cents(stakes[done], leg_factors(prices[done], results[done]), mask)
+        returns.update(zip((slip.id for slip in itertools.compress(group, done)), paid.tolist()))
+    if not returns:
+        return 0, 0
+
+    # Only slips this statement moved out of Open are paid, so racing settlements cannot pay twice
+    settled = set(db.session.scalars(
+        update(BetSlip)
+        .where(BetSlip.id.in_(list(returns)), BetSlip.status == 'Open')
+        .values(status='Settled', settled_at=datetime.utcnow(), returned_cents=case(returns, value=BetSlip.id))
+        .returning(BetSlip.id),
+        execution_options={'synchronize_session': False},
+    ))
+
+    credits = defaultdict(int)
+    deltas = defaultdict(lambda: defaultdict(int))
+    released = defaultdict(lambda: [0, 0])
+    for slip in slips:
+        if slip.id not in settled:
+            continue
+        for selection_id in selections[slip.id]:
+            released[selection_id][0] += slip.total_stake_cents
+            released[selection_id][1] += slip.potential_return_cents
+        returned = returns[slip.id]
+        credits[slip.user_id] += returned
+        user_deltas = deltas[slip.user_id]
+        user_deltas['open_exposure_cents'] -= slip.total_stake_cents
+        if all(result == VOID for _, result in legs[slip.id]):
+            user_deltas['bets_void'] += 1
+            user_deltas['total_refunded_cents'] += returned
+        elif returned:
+            user_deltas['bets_won'] += 1
+            user_deltas['total_won_cents'] += returned
+        else:
+            user_deltas['bets_lost'] += 1
+    ledger.credit_many(credits, 'payout', reference, ledger.HOUSE_BETS)
+    ledger.touch(user_id for user_id in deltas if not credits[user_id])
+    user_stats.bump_many(deltas)
+    risk.release_many(released)
+    return len(settled), sum(credits.values())
+
+
+def settle_chunk(outcomes, reference, after_slip_id=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Record ``{selection_id: result}`` on the next chunk of open slips and settle the decided ones.
+
+    Does not commit. Returns ``(last_slip_id, settled_count, credited_cents)``,
+    with ``last_slip_id`` None once no open slips are left after ``after_slip_id``.
+    """
+    slip_ids = db.session.scalars(
+        select(SlipLeg.slip_id).distinct()
+        .join(BetSlip, BetSlip.id == SlipLeg.slip_id)
+        .where(SlipLeg.selection_id.in_(list(outcomes)), BetSlip.status == 'Open',
+               SlipLeg.slip_id > after_slip_id)
+        .order_by(SlipLeg.slip_id)
+        .limit(chunk_size)
+    ).all()
+    if not slip_ids:
+        return None, 0, 0
+
+    by_result = defaultdict(list)
+    for selection_id, result in outcomes.items():
+        by_result[result].append(selection_id)
+    for result, selection_ids in by_result.items():
+        db.session.execute(
+            update(SlipLeg)
+            .where(SlipLeg.slip_id.in_(slip_ids), SlipLeg.selection_id.in_(selection_ids),
+                   SlipLeg.result == 'Pending')
+            .values(result=result)
+            .execution_options(synchronize_session=False)
+        )
+    settled, credited = settle_slips(slip_ids, reference)
+    return slip_ids[-1], settled, credited
@@ -0,0 +1,143 @@
+"""Database configuration.
+
+Picks the database from ``DATABASE_URL`` (SQLite by default), applies
+connection pragmas to SQLite and bounded pool settings, and routes the queries
+of read-only views to a ``read`` bind, such as a replica given by
+``DATABASE_READ_URL``, when one is configured.
+
+Under gevent (``gunicorn.conf.py``) thousands of requests share a worker, and
+the pool is what bounds how many of them use the database at once: the rest
+wait for a connection cooperatively, up to ``pool_timeout``. psycopg2 is made
+to wait for the server through gevent too when ``psycogreen`` is installed;
+without it a warning is logged and each query blocks its whole worker.
+sqlite3 calls still run on the worker's only thread, so a long write lock wait
+stalls every greenlet of the worker; a server database suits this mode better.
+"""
+import os
+import sys
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+READ_BIND = 'read'
+
+# WAL lets readers run alongside the single writer; NORMAL sync is durable
+# across application crashes (only an OS crash can lose the last commits).
+# INCREMENTAL auto-vacuum only takes effect on a database created with it (or
+# after a VACUUM); it lets ``archive.vacuum`` shrink the file.
+SQLITE_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# SQLAlchemy's own defaults for SQLite files, spelled out so SQLALCHEMY_POOL_* can change them
+SQLITE_POOL_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+}
+
+SERVER_POOL_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+}
+
+
+class RoutingSession(Session):
+    """Session that sends everything to the read bind inside :func:`read_only` views."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('db_read_only'):
+            engine = self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Mark a view as read-only so its queries may be served by the read bind.
+
+    Reads may lag the primary by the replica's replication delay.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def database_url(url):
+    # Some hosts still hand out the pre-1.4 'postgres://' scheme
+    if url and url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def cooperative():
+    """Whether gevent has patched this process, as in gunicorn's gevent workers."""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+def engine_options(app, url):
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        if not url.database or url.database == ':memory:':
+            return {}  # one shared connection, set up by Flask-SQLAlchemy
+        options = dict(SQLITE_POOL_OPTIONS)
+    else:
+        options = dict(SERVER_POOL_OPTIONS)
+    for name in options:
+        options[name] = app.config.get(f'SQLALCHEMY_{name.upper()}', options[name])
+    return options
+
+
+def set_sqlite_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return on_connect
+
+
+def init_app(app, db):
+    url = app.config.setdefault('SQLALCHEMY_DATABASE_URI',
+                                database_url(os.environ.get('DATABASE_URL', 'sqlite:///betting.db')))
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app, url))
+
+    read_url = app.config.setdefault('SQLALCHEMY_READ_URI', database_url(os.environ.get('DATABASE_READ_URL')))
+    if read_url:
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(READ_BIND, dict(url=read_url, **engine_options(app, read_url)))
+
+    if cooperative() and any(make_url(candidate).get_driver_name() == 'psycopg2'
+                             for candidate in (url, read_url) if candidate):
+        # Otherwise every query blocks the whole worker while it waits for the server
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            app.logger.warning('psycogreen is not installed: psycopg2 queries will block the gevent worker')
+        else:
+            patch_psycopg()
+
+    pragmas = dict(SQLITE_PRAGMAS, **app.config.get('SQLITE_PRAGMAS', {}))
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                database = engine.url.database
+                engine_pragmas = dict(pragmas)
+                if not database or database == ':memory:':
+                    engine_pragmas.pop('journal_mode')
+                event.listen(engine, 'connect', set_sqlite_pragmas(engine_pragmas))
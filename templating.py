@@ -0,0 +1,155 @@
+"""Template registry.
+
+Templates live in ``templates/`` and are compiled once: :func:`init_app`
+turns off per-request mtime checks outside debug, stores compiled bytecode on
+disk so new workers skip parsing, and with ``TEMPLATE_PRELOAD`` warms Jinja's
+cache with every template at startup.
+
+Pages that are identical for every visitor can be served from :data:`pages`
+as pre-rendered bytes with an ETag and Last-Modified. A user's own pages are
+served from :data:`user_pages`, keyed by their ``data_version`` (see
+:func:`ledger.touch`): a refresh after no change is answered with 304, or from
+memory, without querying or rendering anything.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import render_template, request, current_app
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.local import LocalProxy
+
+import assets
+
+
+def init_app(app):
+    app.config.setdefault('TEMPLATE_BYTECODE_CACHE_DIR', None)  # None: the system temp dir
+    app.extensions['templating.pages'] = PageCache()
+    app.extensions['templating.user_pages'] = UserPageCache(
+        app.config.setdefault('USER_PAGE_CACHE_BYTES', 32 * 1024 * 1024))
+    if not app.debug:
+        app.config.setdefault('TEMPLATES_AUTO_RELOAD', False)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_BYTECODE_CACHE_DIR'],
+                                                           'bettingking-%s.cache')
+    # Compiling every template up front slows worker boot; by default each one
+    # is loaded (from the bytecode cache) on its first render instead
+    if app.config.setdefault('TEMPLATE_PRELOAD', False):
+        with app.app_context():
+            for name in app.jinja_env.list_templates(extensions=['html']):
+                app.jinja_env.get_template(name)
+
+
+class PageCache:
+    """Rendered bodies of visitor-independent pages, keyed by template and data version."""
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def render(self, template_name, version, **context):
+        page = self._pages.get(template_name)
+        if page is None or page[0] != version:
+            body = render_template(template_name, **context).encode()
+            etag = hashlib.sha1(body).hexdigest()
+            page = (version, body, etag, datetime.now(timezone.utc).replace(microsecond=0))
+            with self._lock:
+                self._pages[template_name] = page
+        return page
+
+    def response(self, template_name, version, **context):
+        """Serve ``template_name`` from cache, answering conditional requests with 304."""
+        _, body, etag, last_modified = self.render(template_name, version, **context)
+        response = current_app.response_class(body, mimetype='text/html')
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+pages = LocalProxy(lambda: current_app.extensions['templating.pages'])
+
+
+class UserPageCache:
+    """Bounded LRU of rendered per-user responses.
+
+    Keys are tuples starting ``(user_id, page, data_version)`` followed by
+    whatever else the page depends on (query arguments, the odds version), so
+    an entry is never invalidated, only left behind when the version moves.
+    The key's hash is a strong ETag: a client that already has the current
+    response gets 304 before the cache is even consulted.
+    """
+
+    def __init__(self, maxbytes=32 * 1024 * 1024):
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._salt = None
+        self._lock = threading.Lock()
+
+    def salt(self):
+        # A deploy that changes the templates, or an asset build that renames the
+        # files they link to, must not leave clients on 304s for the old markup
+        names = assets.manifest.names
+        if self._salt is None or self._salt[0] is not names:
+            digest = hashlib.sha1()
+            env = current_app.jinja_env
+            for name in sorted(env.list_templates()):
+                digest.update(env.loader.get_source(env, name)[0].encode())
+            digest.update(json.dumps(names, sort_keys=True).encode())
+            self._salt = (names, digest.hexdigest())
+        return self._salt[1]
+
+    def etag(self, key):
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.maxbytes and self._entries:
+                self._size -= len(self._entries.popitem(last=False)[1])
+
+    def response(self, key, render, mimetype='text/html'):
+        """Answer with the page for ``key``, calling ``render()`` for its body only on a miss."""
+        # Salted, so bodies and ETags from before a template or asset change are left behind
+        key = (self.salt(),) + key
+        etag = self.etag(key)
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            body = self.get(key)
+            if body is None:
+                body = render().encode()
+                self.put(key, body)
+            response = current_app.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+
+user_pages = LocalProxy(lambda: current_app.extensions['templating.user_pages'])
@@ -0,0 +1,150 @@
+"""Incrementally maintained per-user aggregates.
+
+:func:`bump` and :func:`bump_many` add deltas to ``UserStats`` rows with
+set-based ``UPDATE col = col + :delta`` statements inside the caller's
+transaction, so the dashboard can read the totals with a single primary-key
+lookup. :func:`rebuild` recomputes them from the bets, slips and transactions
+(archives included) in user id ranges, by the same rules as the incremental
+updates; :func:`check` reports the users whose stored totals differ.
+"""
+from sqlalchemy import select, update, insert, delete, bindparam, func
+
+from models import db, User, Bet, ArchivedBet, BetSlip, SlipLeg, Transaction, ArchivedTransaction, UserStats
+import ledger
+
+FIELDS = [column.name for column in UserStats.__table__.columns if column.name != 'user_id']
+REBUILD_BATCH_SIZE = 1000
+
+
+def ensure(user_ids):
+    """Create missing stats rows for ``user_ids``."""
+    user_ids = set(user_ids)
+    existing = set(db.session.scalars(select(UserStats.user_id).where(UserStats.user_id.in_(user_ids))))
+    missing = user_ids - existing
+    if missing:
+        db.session.execute(insert(UserStats), [{'user_id': user_id} for user_id in missing])
+
+
+def bump(user_id, **deltas):
+    result = db.session.execute(
+        update(UserStats).where(UserStats.user_id == user_id)
+        .values({field: getattr(UserStats, field) + delta for field, delta in deltas.items()})
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.execute(insert(UserStats).values(user_id=user_id, **deltas))
+
+
+def bump_many(deltas_by_user):
+    """Apply ``{user_id: {field: delta}}`` with one executemany UPDATE."""
+    if not deltas_by_user:
+        return
+    ensure(deltas_by_user)
+    fields = sorted({field for deltas in deltas_by_user.values() for field in deltas})
+    table = UserStats.__table__
+    db.session.execute(
+        update(table).where(table.c.user_id == bindparam('uid'))
+        .values({field: table.c[field] + bindparam(f'd_{field}') for field in fields}),
+        [dict({'uid': user_id}, **{f'd_{field}': deltas.get(field, 0) for field in fields})
+         for user_id, deltas in deltas_by_user.items()],
+    )
+
+
+def compute(low, high):
+    """Stats of the users with ids from ``low`` to ``high`` worked out from their history, as ``{user_id: row}``."""
+    from settlement import payout_cents
+
+    totals = {}
+
+    def row_of(user_id):
+        return totals.setdefault(user_id, dict.fromkeys(FIELDS, 0))
+
+    bets = [select(model.user_id, model.amount_cents, model.odds, model.result)
+            .where(model.user_id.between(low, high)).execution_options(yield_per=10000)
+            for model in (Bet, ArchivedBet)]
+    for user_id, amount_cents, price, result in (row for query in bets for row in db.session.execute(query)):
+        row = row_of(user_id)
+        row['bets_placed'] += 1
+        row['total_staked_cents'] += amount_cents
+        if result == 'Win':
+            row['bets_won'] += 1
+            row['total_won_cents'] += payout_cents(amount_cents, result, price)
+        elif result == 'Lose':
+            row['bets_lost'] += 1
+        elif result == 'Void':
+            row['bets_void'] += 1
+            row['total_refunded_cents'] += amount_cents
+        else:
+            row['open_exposure_cents'] += amount_cents
+
+    # A slip counts as one bet, void when every leg was (see slips.settle_slips)
+    live_legs = (select(func.count(SlipLeg.id)).where(SlipLeg.slip_id == BetSlip.id, SlipLeg.result != 'Void')
+                 .scalar_subquery())
+    slips = (select(BetSlip.user_id, BetSlip.total_stake_cents, BetSlip.status, BetSlip.returned_cents, live_legs)
+             .where(BetSlip.user_id.between(low, high)).execution_options(yield_per=10000))
+    for user_id, total_stake_cents, status, returned_cents, live in db.session.execute(slips):
+        row = row_of(user_id)
+        row['bets_placed'] += 1
+        row['total_staked_cents'] += total_stake_cents
+        if status == 'Open':
+            row['open_exposure_cents'] += total_stake_cents
+        elif not live:
+            row['bets_void'] += 1
+            row['total_refunded_cents'] += returned_cents or 0
+        elif returned_cents:
+            row['bets_won'] += 1
+            row['total_won_cents'] += returned_cents
+        else:
+            row['bets_lost'] += 1
+
+    transactions = [
+        select(model.user_id, model.type, func.sum(model.amount_cents))
+        # Failed withdrawals are refunded and taken back out of the total (see withdrawals.process)
+        .where(model.user_id.between(low, high), model.status != 'Failed')
+        .group_by(model.user_id, model.type)
+        for model in (Transaction, ArchivedTransaction)
+    ]
+    for user_id, kind, amount_cents in (row for query in transactions for row in db.session.execute(query)):
+        field = 'total_deposited_cents' if kind == 'deposit' else 'total_withdrawn_cents'
+        row_of(user_id)[field] += amount_cents
+    return totals
+
+
+def user_ranges(batch_size):
+    last_id = 0
+    while True:
+        user_ids = db.session.scalars(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ).all()
+        if not user_ids:
+            return
+        yield user_ids
+        last_id = user_ids[-1]
+
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE, progress=None):
+    """Recompute every user's stats from scratch, one committed id range at a time."""
+    for user_ids in user_ranges(batch_size):
+        low, high = user_ids[0], user_ids[-1]
+        totals = compute(low, high)
+        db.session.execute(delete(UserStats).where(UserStats.user_id.between(low, high)))
+        db.session.execute(insert(UserStats), [dict(totals.get(user_id) or dict.fromkeys(FIELDS, 0), user_id=user_id)
+                                               for user_id in user_ids])
+        ledger.touch(user_ids)
+        db.session.commit()
+        if progress:
+            progress(high)
+
+
+def check(batch_size=REBUILD_BATCH_SIZE):
+    """Yield ``(user_id, stored, rebuilt)`` for every user whose stored stats differ from :func:`compute`."""
+    empty = dict.fromkeys(FIELDS, 0)
+    for user_ids in user_ranges(batch_size):
+        low, high = user_ids[0], user_ids[-1]
+        totals = compute(low, high)
+        stored = {row.user_id: {field: getattr(row, field) for field in FIELDS}
+                  for row in db.session.scalars(select(UserStats).where(UserStats.user_id.between(low, high)))}
+        for user_id in user_ids:
+            rebuilt, found = totals.get(user_id, empty), stored.get(user_id, empty)
+            if rebuilt != found:
+                yield user_id, found, rebuilt
@@ -0,0 +1,187 @@
+"""Pages and forms of the betting site."""
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, abort, current_app,
+                   stream_with_context)
+from flask_login import login_required, current_user
+
+from models import db, UserStats
+from money import to_cents
+import betting
+import export
+import history
+import idempotency
+import ledger
+import odds
+import odds_stream
+import ratelimit
+import risk
+import storage
+import templating
+import user_stats
+
+bp = Blueprint('web', __name__)
+
+
+@bp.route('/')
+def home():
+    # The home page only changes when prices do, so it is served pre-rendered
+    board = odds.cache.snapshot()
+    return templating.pages.response('home.html', board.version, board=board)
+
+
+@bp.route('/odds/stream')
+def stream_odds():
+    if not current_app.config['ODDS_STREAM_ENABLED']:
+        return '', 204
+    frames = odds_stream.broker.stream(request.headers.get('Last-Event-ID', type=int))
+    response = current_app.response_class(frames, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+
+@bp.route('/dashboard')
+@login_required
+def dashboard():
+    board = odds.cache.snapshot()
+    selected = request.args.get('selection', type=int)
+
+    def render():
+        stats = db.session.get(UserStats, current_user.id) or UserStats(**dict.fromkeys(user_stats.FIELDS, 0))
+        return render_template('dashboard.html', user=current_user, stats=stats, board=board, selected=selected)
+    key = (current_user.id, 'dashboard', current_user.data_version, board.version, selected)
+    return templating.user_pages.response(key, render)
+
+
+@bp.route('/place_bet', methods=['POST'])
+@ratelimit.limit('bet', '30/minute')
+@login_required
+@idempotency.idempotent
+def place_bet():
+    try:
+        amount_cents = to_cents(request.form.get('amount'))
+    except ValueError:
+        flash('Invalid amount')
+        return redirect(url_for('web.dashboard'))
+
+    try:
+        bet = betting.place_bet(current_user.id, amount_cents, request.form.get('selection_id', type=int),
+                                request.form.get('odds_version', type=int))
+    except LookupError:
+        flash('That selection is no longer open for betting')
+        return redirect(url_for('web.dashboard'))
+    except odds.OddsChanged:
+        flash('The odds have changed, please review your bet')
+        return redirect(url_for('web.dashboard', selection=request.form.get('selection_id')))
+    except risk.LimitExceeded:
+        db.session.rollback()
+        flash('This selection is not accepting more bets of that size')
+        return redirect(url_for('web.dashboard'))
+    except ledger.InsufficientFunds:
+        db.session.rollback()
+        flash('Insufficient balance')
+        return redirect(url_for('web.dashboard'))
+    db.session.commit()
+
+    flash(f'Bet placed successfully at {bet.odds}')
+    return redirect(url_for('web.dashboard'))
+
+
+@bp.route('/bet_history')
+@login_required
+@storage.read_only
+def bet_history():
+    result, order, cursor, limit = history.page_args(request.args)
+
+    def render():
+        bets, next_cursor = history.bet_page(current_user.id, result, order, cursor, limit)
+        return render_template('bet_history.html', bets=bets, next_cursor=next_cursor,
+                               result=result, order=order, cursor=cursor, limit=limit)
+    key = (current_user.id, 'bet_history', current_user.data_version, result, order, cursor, limit)
+    return templating.user_pages.response(key, render)
+
+
+@bp.route('/bet_history/page')
+@login_required
+@storage.read_only
+def bet_history_page():
+    result, order, cursor, limit = history.page_args(request.args)
+
+    def render():
+        bets, next_cursor = history.bet_page(current_user.id, result, order, cursor, limit)
+        return current_app.json.dumps({'bets': [bet.to_dict() for bet in bets], 'next_cursor': next_cursor})
+    key = (current_user.id, 'bet_history_page', current_user.data_version, result, order, cursor, limit)
+    return templating.user_pages.response(key, render, 'application/json')
+
+
+@bp.route('/deposit', methods=['GET', 'POST'])
+@ratelimit.limit('wallet', '10/minute')
+@login_required
+@idempotency.idempotent
+def deposit():
+    if request.method == 'POST':
+        try:
+            amount_cents = to_cents(request.form.get('amount'))
+        except ValueError:
+            flash('Invalid amount')
+            return redirect(url_for('web.deposit'))
+        new_transaction = betting.deposit(current_user.id, amount_cents)
+        db.session.commit()
+        flash(f'Deposit of ${new_transaction.amount} successful')
+        return redirect(url_for('web.dashboard'))
+    return render_template('deposit.html')
+
+
+@bp.route('/withdraw', methods=['GET', 'POST'])
+@ratelimit.limit('wallet', '10/minute')
+@login_required
+@idempotency.idempotent
+def withdraw():
+    if request.method == 'POST':
+        try:
+            amount_cents = to_cents(request.form.get('amount'))
+        except ValueError:
+            flash('Invalid amount')
+            return redirect(url_for('web.withdraw'))
+        try:
+            new_transaction = betting.withdraw(current_user.id, amount_cents)
+        except ledger.InsufficientFunds:
+            db.session.rollback()
+            flash('Insufficient balance')
+        else:
+            db.session.commit()
+            flash(f'Withdrawal of ${new_transaction.amount} requested')
+        return redirect(url_for('web.dashboard'))
+    return render_template('withdraw.html', user=current_user)
+
+
+@bp.route('/transactions')
+@login_required
+@storage.read_only
+def transactions():
+    _, order, cursor, limit = history.page_args(request.args)
+
+    def render():
+        rows, next_cursor = history.transaction_page(current_user.id, order, cursor, limit)
+        return render_template('transactions.html', transactions=rows, next_cursor=next_cursor,
+                               order=order, cursor=cursor, limit=limit)
+    key = (current_user.id, 'transactions', current_user.data_version, order, cursor, limit)
+    return templating.user_pages.response(key, render)
+
+
+@bp.route('/export/<any(bets, transactions):kind>.<any(csv, jsonl):fmt>')
+@login_required
+@storage.read_only
+def export_history(kind, fmt):
+    try:
+        start = export.parse_date(request.args.get('start'))
+        end = export.parse_date(request.args.get('end'), end=True)
+    except ValueError:
+        abort(400)
+    compress = bool(request.accept_encodings['gzip'])
+    body = export.stream(kind, fmt, current_user.id, start, end, compress)
+    response = current_app.response_class(stream_with_context(body), mimetype=export.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={kind}.{fmt}'
+    response.vary.add('Accept-Encoding')
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,186 @@
+"""Background withdrawal payouts.
+
+``withdraw()`` debits the balance and enqueues a ``PayoutJob`` in the same
+transaction; nothing talks to the payout provider on a web thread. Workers
+claim due jobs in batches: with ``SELECT ... FOR UPDATE SKIP LOCKED`` where
+the database supports it, otherwise (SQLite) with a conditional ``UPDATE``
+that stamps a claim token on still-queued rows. A claim is a lease, so jobs
+held by a crashed worker become claimable again after ``lease_seconds``.
+
+Failed payouts are retried with exponential backoff; after ``max_attempts``
+the transaction is marked Failed and the amount is refunded through the
+ledger. Withdrawals above ``WITHDRAWAL_APPROVAL_THRESHOLD`` are Held until an
+admin approves them, which can be done for a whole batch at once.
+"""
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import select, update, or_, and_
+from werkzeug.utils import import_string
+
+from models import db, PayoutJob
+import ledger
+import user_stats
+
+DEFAULT_BATCH_SIZE = 50
+
+
+class PayoutError(Exception):
+    """Raised by providers; ``retryable=False`` fails the withdrawal immediately."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class PayoutProvider:
+    """Interface of payout backends."""
+
+    def send(self, transaction, idempotency_key):
+        """Pay ``transaction`` out and return the provider's reference.
+
+        ``idempotency_key`` is stable across retries of the same withdrawal so
+        the provider can drop duplicates if a worker dies after paying.
+        """
+        raise NotImplementedError
+
+
+class FakePayoutProvider(PayoutProvider):
+    """Local stand-in that succeeds after ``latency`` seconds, failing a ``failure_rate`` share."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = {}
+
+    def send(self, transaction, idempotency_key):
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise PayoutError('fake provider declined the payout')
+        return self.sent.setdefault(idempotency_key, f'fake-{uuid4().hex[:16]}')
+
+
+def load_provider(app):
+    provider = app.config.setdefault('PAYOUT_PROVIDER', 'withdrawals.FakePayoutProvider')
+    if isinstance(provider, str):
+        provider = import_string(provider)(**app.config.get('PAYOUT_PROVIDER_OPTIONS', {}))
+    return provider
+
+
+def enqueue(transaction, approval_threshold_cents=None):
+    held = approval_threshold_cents is not None and transaction.amount_cents > approval_threshold_cents
+    job = PayoutJob(transaction=transaction, status='Held' if held else 'Queued')
+    db.session.add(job)
+    return job
+
+
+def approve(job_ids=None):
+    """Release held jobs (all of them if ``job_ids`` is None) to the workers. Commits."""
+    query = update(PayoutJob).where(PayoutJob.status == 'Held')
+    if job_ids is not None:
+        query = query.where(PayoutJob.id.in_(job_ids))
+    count = db.session.execute(query.values(status='Queued', next_attempt_at=datetime.utcnow())).rowcount
+    db.session.commit()
+    return count
+
+
+def due(now, lease_seconds):
+    return or_(
+        and_(PayoutJob.status == 'Queued', PayoutJob.next_attempt_at <= now),
+        and_(PayoutJob.status == 'Processing', PayoutJob.claimed_at < now - timedelta(seconds=lease_seconds)),
+    )
+
+
+def claim(worker_id, batch_size=DEFAULT_BATCH_SIZE, lease_seconds=300):
+    """Claim up to ``batch_size`` due jobs and commit; returns ``(token, jobs)``."""
+    now = datetime.utcnow()
+    token = f'{worker_id}:{uuid4().hex[:12]}'
+    candidates = select(PayoutJob.id).where(due(now, lease_seconds)).order_by(PayoutJob.id).limit(batch_size)
+    if db.engine.dialect.name in ('postgresql', 'mysql', 'mariadb', 'oracle'):
+        ids = db.session.scalars(candidates.with_for_update(skip_locked=True)).all()
+        condition = PayoutJob.id.in_(ids)
+    else:
+        # No row locks: the re-checked due() condition lets only one claimer win each row
+        ids = db.session.scalars(candidates).all()
+        condition = and_(PayoutJob.id.in_(ids), due(now, lease_seconds))
+    if ids:
+        db.session.execute(
+            update(PayoutJob).where(condition)
+            .values(status='Processing', claimed_by=token, claimed_at=now, attempts=PayoutJob.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    if not ids:
+        return token, []
+    jobs = db.session.scalars(select(PayoutJob).where(PayoutJob.claimed_by == token).order_by(PayoutJob.id)).all()
+    return token, jobs
+
+
+def backoff(attempts, base=30, cap=3600):
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def finish(job, token, **values):
+    """Update ``job`` only if this worker still holds its claim. Returns True if it did."""
+    result = db.session.execute(
+        update(PayoutJob).where(PayoutJob.id == job.id, PayoutJob.claimed_by == token,
+                                PayoutJob.status == 'Processing')
+        .values(claimed_by=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def process(job, token, provider, max_attempts=5):
+    transaction = job.transaction
+    try:
+        reference = provider.send(transaction, f'transaction:{transaction.id}')
+    except Exception as e:
+        # Anything but an explicit non-retryable PayoutError (timeouts, bugs) is retried
+        if getattr(e, 'retryable', True) and job.attempts < max_attempts:
+            if finish(job, token, status='Queued', last_error=str(e),
+                      next_attempt_at=datetime.utcnow() + backoff(job.attempts)):
+                db.session.commit()
+            return 'retry'
+        if finish(job, token, status='Failed', last_error=str(e)):
+            transaction.status = 'Failed'
+            ledger.credit(transaction.user_id, transaction.amount_cents, 'refund', f'transaction:{transaction.id}')
+            user_stats.bump(transaction.user_id, total_withdrawn_cents=-transaction.amount_cents)
+        db.session.commit()
+        return 'failed'
+
+    if finish(job, token, status='Done', provider_reference=reference, last_error=None):
+        transaction.status = 'Completed'
+        ledger.touch([transaction.user_id])
+    db.session.commit()
+    return 'done'
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def run_worker(provider, worker_id=None, batch_size=DEFAULT_BATCH_SIZE, poll_interval=2.0,
+               max_attempts=5, lease_seconds=300, once=False, log=None):
+    """Claim and process batches until stopped (or until the queue is drained when ``once``)."""
+    worker_id = worker_id or default_worker_id()
+    while True:
+        token, jobs = claim(worker_id, batch_size, lease_seconds)
+        counts = {}
+        for job in jobs:
+            outcome = process(job, token, provider, max_attempts)
+            counts[outcome] = counts.get(outcome, 0) + 1
+        if jobs and log:
+            log(f'{worker_id}: {len(jobs)} payouts claimed, ' +
+                ', '.join(f'{count} {outcome}' for outcome, count in sorted(counts.items())))
+        if not jobs:
+            if once:
+                return
+            time.sleep(poll_interval)
+        db.session.remove()
@@ -0,0 +1,4 @@
+"""WSGI entry point: ``gunicorn wsgi:app``. The ``flask`` command finds it too."""
+from main import create_app
+
+app = create_app()